@@ -0,0 +1,108 @@
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Out-of-core summaries of all trips, computed by DuckDB.
+
+Each query scans the parquet dataset, or the trip table of taxi.db,
+in a streaming fashion, and only the small aggregated result comes back
+as a pandas frame.  So memory stays bounded however many trips there are.
+Reading taxi.db needs DuckDB's sqlite extension, which DuckDB downloads
+on first use, so do that once while online, or query the parquet dataset.
+"""
+
+import re
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+from constant.ch02_taxi.jh.features import COMPRESSED_DATASET
+from constant.util.timing import timed
+
+
+def trip_source(in_file: Path = COMPRESSED_DATASET) -> str:
+    """Returns a DuckDB table expression for IN_FILE, a parquet dataset or taxi.db."""
+    path = str(in_file).replace("'", "''")  # quoted as an SQL string literal
+    if in_file.suffix == ".db":
+        return f"sqlite_scan('{path}', 'trip')"  # via DuckDB's sqlite extension
+    if in_file.is_dir():
+        return f"read_parquet('{path}/**/*.parquet', hive_partitioning = true)"
+    return f"read_parquet('{path}')"
+
+
+def _query(sql: str, in_file: Path, *params: object) -> pd.DataFrame:
+    sql = sql.replace("{trip}", trip_source(in_file))
+    with duckdb.connect() as conn:
+        if in_file.suffix == ".db":
+            _load_sqlite_extension(conn)
+        return conn.execute(sql, list(params)).df()
+
+
+def _load_sqlite_extension(conn: duckdb.DuckDBPyConnection) -> None:
+    try:
+        conn.execute("LOAD sqlite")  # installing it first, if need be
+    except duckdb.Error as e:
+        raise RuntimeError(
+            "Reading taxi.db needs DuckDB's sqlite extension (sqlite_scanner),"
+            " which could not be loaded.  Run `INSTALL sqlite` in DuckDB"
+            f" while online, or query the parquet dataset instead.  {e}"
+        ) from e
+
+
+def _columns(names: tuple[str, ...]) -> str:
+    for name in names:
+        assert re.fullmatch(r"\w+", name), name
+    return ", ".join(names)
+
+
+@timed
+def min_elapsed_by_distance(
+    bucket_meters: float = 1000, in_file: Path = COMPRESSED_DATASET
+) -> pd.DataFrame:
+    """Returns the quickest trip, in seconds, for each distance_km bucket."""
+    sql = """
+        SELECT    CAST(floor(distance / ?) AS INTEGER)  AS distance_km,
+                  min(trip_duration)                    AS elapsed
+        FROM      {trip}
+        GROUP BY  distance_km
+        ORDER BY  distance_km
+    """
+    return _query(sql, in_file, bucket_meters)
+
+
+@timed
+def trip_counts(
+    by: tuple[str, ...] = ("hour", "pickup_zone"), in_file: Path = COMPRESSED_DATASET
+) -> pd.DataFrame:
+    """Returns the number of trips for each combination of the BY columns."""
+    cols = _columns(by)
+    sql = f"""
+        SELECT    {cols},  count(*)  AS trips
+        FROM      {{trip}}
+        GROUP BY  {cols}
+        ORDER BY  {cols}
+    """
+    return _query(sql, in_file)
+
+
+@timed
+def speed_quantiles(
+    by: tuple[str, ...] = ("hour",),
+    quantiles: tuple[float, ...] = (0.1, 0.5, 0.9),
+    in_file: Path = COMPRESSED_DATASET,
+) -> pd.DataFrame:
+    """Returns quantiles of average speed, in meters per second, for each BY group.
+
+    Each quantile gets a column, e.g. q50 for the median.
+    """
+    cols = _columns(by)
+    qs = ",\n".join(
+        f"quantile_cont(distance / trip_duration, {q:.3f})  AS q{round(100 * q)}"
+        for q in quantiles
+    )
+    sql = f"""
+        SELECT    {cols},  {qs}
+        FROM      {{trip}}
+        WHERE     trip_duration > 0
+        GROUP BY  {cols}
+        ORDER BY  {cols}
+    """
+    return _query(sql, in_file)
@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+import sqlalchemy as sa
+
+from constant.ch02_taxi.jh.aggregates import (
+    min_elapsed_by_distance,
+    speed_quantiles,
+    trip_counts,
+)
+from constant.ch02_taxi.jh.bulk_load import BulkLoader
+from constant.ch02_taxi.jh.dataset import TripDatasetWriter
+
+
+class AggregatesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp = TemporaryDirectory()
+        self.dataset = Path(self.temp.name) / "trip.parquet"
+        pickup = pd.date_range("2016-01-31 22:00", periods=8, freq="30min")
+        df = pd.DataFrame(
+            {
+                "pickup_datetime": pickup,
+                "hour": pickup.hour,
+                "pickup_zone": ["Midtown Center", "JFK Airport"] * 4,
+                "distance": [500.0, 1500, 1800, 2500, 900, 1200, 3000, 100],
+                "trip_duration": [100, 300, 200, 400, 90, 600, 300, 10],
+            }
+        )
+        with TripDatasetWriter(self.dataset) as writer:
+            writer.write(df)
+        self.df = df
+
+    def tearDown(self) -> None:
+        self.temp.cleanup()
+
+    def test_min_elapsed_by_distance(self) -> None:
+        df = min_elapsed_by_distance(in_file=self.dataset)
+        self.assertEqual([0, 1, 2, 3], list(df.distance_km))
+        self.assertEqual([10, 200, 400, 300], list(df.elapsed))
+
+    def test_trip_counts(self) -> None:
+        df = trip_counts(in_file=self.dataset)
+        self.assertEqual([0, 0, 1, 1, 22, 22, 23, 23], list(df.hour))
+        self.assertEqual({1}, set(df.trips))
+
+        df = trip_counts(("pickup_month",), self.dataset)
+        self.assertEqual(
+            {"2016-01": 4, "2016-02": 4}, dict(zip(df.pickup_month, df.trips))
+        )
+
+    def test_speed_quantiles(self) -> None:
+        df = speed_quantiles(("pickup_zone",), (0.5,), self.dataset)
+        self.assertEqual(["JFK Airport", "Midtown Center"], list(df.pickup_zone))
+        self.assertAlmostEqual(5.625, df.q50[0])  # median of 2, 5, 6.25, 10
+        self.assertAlmostEqual(9.5, df.q50[1])  # median of 5, 9, 10, 10
+
+    def test_quoted_path(self) -> None:
+        folder = Path(self.temp.name) / "Jake's trips"
+        folder.mkdir()
+        self.dataset.rename(folder / "trip.parquet")
+        df = trip_counts(("hour",), folder / "trip.parquet")
+        self.assertEqual([2, 2, 2, 2], list(df.trips))
+
+    def test_sqlite_source(self) -> None:
+        db_file = Path(self.temp.name) / "Jake's taxi.db"
+        engine = sa.create_engine(f"sqlite:///{db_file}")
+        with engine.begin() as conn:
+            conn.execute(
+                sa.text(
+                    "CREATE TABLE trip (pickup_datetime DATETIME, hour INTEGER,"
+                    " pickup_zone TEXT, distance FLOAT, trip_duration INTEGER)"
+                )
+            )
+        with BulkLoader(engine, "trip") as loader:
+            loader.insert(self.df)
+        engine.dispose()
+
+        try:
+            df = trip_counts(("hour",), db_file)
+        except RuntimeError as e:  # e.g. offline, with the extension not installed
+            self.assertIn("sqlite extension", str(e))
+            self.skipTest(str(e))
+        pd.testing.assert_frame_equal(trip_counts(("hour",), self.dataset), df)
@@ -0,0 +1,179 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Throughput and memory benchmarks of the ETL stages, on synthetic trips.
+
+Each stage runs on the output of the stages before it, as in Etl._transform(),
+at several scales.  The best of a few timed runs gives rows/sec, and one more
+run under tracemalloc gives peak memory.  Results go to a JSON file, and a run
+can be compared against an earlier one, to flag regressions.
+"""
+
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+import typer
+
+from constant.ch02_taxi.jh.bulk_load import BulkLoader
+from constant.ch02_taxi.jh.dataset import TripDatasetWriter, load_trips
+from constant.ch02_taxi.jh.etl import Etl, discard_outlier_rows
+from constant.ch02_taxi.jh.features import add_pickup_dow_hour, add_tlc_zone
+from constant.ch02_taxi.jh.synthetic import synthetic_trips, synthetic_zones, taxi_bbox
+from constant.ch02_taxi.jh.zones import TlcZoneIndex
+from constant.util.logger import configure_logging
+from constant.util.path import temp_dir
+
+BENCHMARK_JSON = temp_dir() / "constant/benchmark.json"
+SCALES = [10_000, 100_000, 1_000_000, 10_000_000]
+
+log = getLogger(__name__)
+
+
+def _sqlite_load(df: pd.DataFrame) -> pd.DataFrame:
+    with TemporaryDirectory() as temp:
+        engine = sa.create_engine(f"sqlite:///{temp}/taxi.db", echo=False)
+        with engine.begin() as sess:
+            sess.execute(Etl.ddl)
+        with BulkLoader(engine, "trip", Etl.post_load_sql) as loader:
+            loader.insert(df)
+        engine.dispose()
+    return df
+
+
+def _parquet_round_trip(df: pd.DataFrame) -> pd.DataFrame:
+    with TemporaryDirectory() as temp:
+        dataset = Path(temp) / "trip.parquet"
+        with TripDatasetWriter(dataset) as writer:
+            writer.write(df)
+        out = load_trips(in_file=dataset)
+    assert len(out) == len(df)
+    return df
+
+
+def stages(zones: TlcZoneIndex) -> dict[str, Callable[[pd.DataFrame], pd.DataFrame]]:
+    """Returns the benchmarked stages, in pipeline order."""
+    return {
+        "discard_outlier_rows": discard_outlier_rows,
+        "add_direction_and_distance": Etl._add_direction_and_distance,
+        "add_pickup_dow_hour": add_pickup_dow_hour,
+        "add_tlc_zone": lambda df: add_tlc_zone(df, zones),
+        "sqlite_load": _sqlite_load,
+        "parquet_round_trip": _parquet_round_trip,
+    }
+
+
+def measure(
+    stage: Callable[[pd.DataFrame], pd.DataFrame], df: pd.DataFrame, repeat: int = 3
+) -> tuple[dict[str, float], pd.DataFrame]:
+    """Returns the stage's best time, rows/sec and peak memory, and its output.
+
+    Each run gets its own copy of DF, made outside of the measurement.
+    """
+    seconds = []
+    for _ in range(repeat):
+        data = df.copy()
+        t0 = perf_counter()
+        stage(data)
+        seconds.append(perf_counter() - t0)
+
+    data = df.copy()
+    tracemalloc.start()
+    try:
+        out = stage(data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    best = min(seconds)
+    stats = dict(seconds=best, rows_per_sec=len(df) / best, peak_mb=peak / 2**20)
+    return stats, out
+
+
+def run_benchmarks(
+    scales: list[int] = SCALES, repeat: int = 3, seed: int = 0
+) -> dict[str, Any]:
+    """Returns {"meta": ..., "results": {stage: {scale: stats}}}."""
+    zones = TlcZoneIndex(synthetic_zones(0.07, taxi_bbox()), cell_size=500)
+    results: dict[str, dict[str, dict[str, float]]] = {}
+    for num_rows in scales:
+        df = synthetic_trips(num_rows, seed)
+        for name, stage in stages(zones).items():
+            stats, df = measure(stage, df, repeat)
+            results.setdefault(name, {})[str(num_rows)] = stats
+            log.info(
+                f"  {name:>20} {num_rows:>12_} rows:"
+                f" {stats['rows_per_sec']:14_.0f} rows/sec, {stats['peak_mb']:8.1f} MiB"
+            )
+    meta = dict(
+        created=datetime.now().isoformat(timespec="seconds"),
+        python=sys.version.split()[0],
+        numpy=np.__version__,
+        pandas=pd.__version__,
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        repeat=repeat,
+    )
+    return dict(meta=meta, results=results)
+
+
+def compare(
+    baseline: dict[str, Any], current: dict[str, Any], threshold: float = 0.2
+) -> pd.DataFrame:
+    """Returns a row per stage and scale found in both runs, flagging regressions.
+
+    A regression is throughput that fell, or peak memory that grew,
+    by more than the THRESHOLD fraction of the baseline.
+    """
+    rows = []
+    for name, scales in current["results"].items():
+        for scale, stats in scales.items():
+            base = baseline["results"].get(name, {}).get(scale)
+            if base is None:
+                continue
+            speed = stats["rows_per_sec"] / base["rows_per_sec"]
+            memory = stats["peak_mb"] / base["peak_mb"] if base["peak_mb"] else 1.0
+            rows.append(
+                dict(
+                    stage=name,
+                    rows=int(scale),
+                    speed=speed,
+                    memory=memory,
+                    regression=speed < 1 - threshold or memory > 1 + threshold,
+                )
+            )
+    return pd.DataFrame(
+        rows, columns=["stage", "rows", "speed", "memory", "regression"]
+    )
+
+
+def main(
+    scales: list[int] = SCALES,
+    repeat: int = 3,
+    out_file: Path = BENCHMARK_JSON,
+    baseline: Path | None = None,
+    threshold: float = 0.2,
+) -> None:
+    """Benchmarks the stages, and optionally compares against a BASELINE file."""
+    current = run_benchmarks(scales, repeat)
+    out_file.write_text(json.dumps(current, indent=2))
+    log.info(f"  wrote {out_file}")
+    if baseline:
+        report = compare(json.loads(baseline.read_text()), current, threshold)
+        print(report.round(3).to_string(index=False))
+        if report.regression.any():
+            raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    configure_logging()
+    typer.run(main)
@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+from copy import deepcopy
+
+from constant.ch02_taxi.jh.benchmark import compare, run_benchmarks
+from constant.ch02_taxi.jh.etl import discard_outlier_rows
+from constant.ch02_taxi.jh.synthetic import synthetic_trips, taxi_bbox
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_synthetic_trips(self) -> None:
+        df = synthetic_trips(10_000)
+        self.assertEqual(10_000, len(df))
+        self.assertEqual(10_000, df.id.nunique())
+        clean = discard_outlier_rows(df.copy())
+        self.assertLess(len(clean), len(df))
+        self.assertGreater(len(clean), 0.99 * len(df))
+
+        west, south, east, north = taxi_bbox()
+        self.assertTrue(clean.pickup_longitude.between(west, east).all())
+        self.assertTrue(clean.dropoff_latitude.between(south, north).all())
+
+    def test_run_benchmarks(self) -> None:
+        current = run_benchmarks([1_000, 2_000], repeat=1)
+        self.assertEqual(
+            [
+                "discard_outlier_rows",
+                "add_direction_and_distance",
+                "add_pickup_dow_hour",
+                "add_tlc_zone",
+                "sqlite_load",
+                "parquet_round_trip",
+            ],
+            list(current["results"]),
+        )
+        stats = current["results"]["add_tlc_zone"]["2000"]
+        self.assertGreater(stats["rows_per_sec"], 0)
+        self.assertGreater(stats["peak_mb"], 0)
+
+        report = compare(current, current)
+        self.assertEqual(12, len(report))
+        self.assertFalse(report.regression.any())
+
+        slower = deepcopy(current)
+        slower["results"]["add_direction_and_distance"]["1000"]["rows_per_sec"] /= 2
+        report = compare(current, slower, threshold=0.2)
+        regressed = report[report.regression]
+        self.assertEqual(
+            [("add_direction_and_distance", 1_000)],
+            list(zip(regressed.stage, regressed.rows)),
+        )
+        self.assertEqual(0.5, regressed.speed.iloc[0])
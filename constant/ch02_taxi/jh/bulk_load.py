@@ -0,0 +1,108 @@
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Fast bulk loading of DataFrames into SQLite tables."""
+
+from logging import getLogger
+from time import time
+from types import TracebackType
+from typing import Any, Iterable
+
+import pandas as pd
+import sqlalchemy as sa
+
+log = getLogger(__name__)
+
+# Same text that SQLAlchemy's DATETIME stores, so the table is unchanged vs to_sql().
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# Durability matters little while loading a table we can always rebuild.
+LOAD_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "cache_size": "-262144",  # KiB, so 256 MiB
+    "temp_store": "MEMORY",
+}
+RESTORE_PRAGMAS = {
+    "journal_mode": "DELETE",
+    "synchronous": "FULL",
+}
+
+
+class BulkLoader:
+    """Appends DataFrames to an existing SQLite table, many rows per transaction.
+
+    Use it as a context manager.  While loading, the connection trades
+    durability for speed.  On a clean exit the POST_LOAD_SQL statements
+    (e.g. CREATE INDEX) run, once all the data is in, and the rate is logged.
+    """
+
+    def __init__(
+        self,
+        engine: sa.Engine,
+        table: str,
+        post_load_sql: Iterable[str] = (),
+        batch_size: int = 100_000,
+    ) -> None:
+        self.engine = engine
+        self.table = table
+        self.post_load_sql = list(post_load_sql)
+        self.batch_size = batch_size
+        self.rows = 0
+        self.elapsed = 0.0  # seconds spent inserting, excluding the caller's work
+
+    def __enter__(self) -> "BulkLoader":
+        self.conn = self.engine.raw_connection()
+        self._pragmas(LOAD_PRAGMAS)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        t0 = time()
+        try:
+            if exc is None:
+                cur = self.conn.cursor()
+                for sql in self.post_load_sql:
+                    cur.execute(sql)
+                self.conn.commit()
+            self._pragmas(RESTORE_PRAGMAS)
+        finally:
+            self.conn.close()
+        self.elapsed += time() - t0
+
+        rate = self.rows / self.elapsed if self.elapsed else 0.0
+        log.info(
+            f"  Loaded {self.rows:_} {self.table} rows, {rate:_.0f} rows/sec",
+            extra=dict(stage="bulk_load", rows=self.rows),
+        )
+
+    def insert(self, df: pd.DataFrame) -> None:
+        t0 = time()
+        cols = ", ".join(df.columns)
+        params = ", ".join("?" * len(df.columns))
+        sql = f"INSERT INTO {self.table} ({cols}) VALUES ({params})"
+        cur = self.conn.cursor()
+        for i in range(0, len(df), self.batch_size):
+            cur.executemany(sql, _rows(df.iloc[i : i + self.batch_size]))
+            self.conn.commit()
+        self.rows += len(df)
+        self.elapsed += time() - t0
+
+    def _pragmas(self, pragmas: dict[str, str]) -> None:
+        self.conn.commit()  # journal_mode cannot change within a transaction
+        cur = self.conn.cursor()
+        for name, value in pragmas.items():
+            cur.execute(f"PRAGMA {name} = {value}")
+
+
+def _rows(df: pd.DataFrame) -> list[tuple[Any, ...]]:
+    """Returns plain python values, with None for missing ones, row by row."""
+    cols = []
+    for _, col in df.items():
+        if pd.api.types.is_datetime64_any_dtype(col):
+            col = col.dt.strftime(SQLITE_DATETIME_FORMAT)
+        col = col.astype(object)
+        cols.append(col.where(col.notna(), None).tolist())
+    return list(zip(*cols))
@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+from constant.ch02_taxi.jh.bulk_load import BulkLoader
+
+
+class BulkLoaderTest(unittest.TestCase):
+    ddl = """
+    CREATE TABLE trip (
+        id      TEXT  PRIMARY KEY,
+        pickup  DATETIME,
+        n       INTEGER,
+        x       FLOAT,
+        zone    TEXT
+    )
+    """
+
+    def setUp(self) -> None:
+        self.df = pd.DataFrame(
+            {
+                "id": ["id1", "id2", "id3"],
+                "pickup": pd.to_datetime(
+                    ["2016-03-14 17:24:55", None, "2016-06-12 08:00:00"]
+                ),
+                "n": [1, 2, 3],
+                "x": [40.75, np.nan, -73.98],
+                "zone": ["Midtown Center", None, "JFK Airport"],
+            }
+        )
+
+    def test_same_table_as_to_sql(self) -> None:
+        with TemporaryDirectory() as temp:
+            expected = self._load(Path(temp) / "expected.db", bulk=False)
+            actual = self._load(Path(temp) / "actual.db", bulk=True)
+        self.assertEqual(expected, actual)
+        self.assertEqual(3, len(actual))
+        self.assertEqual(("id2", None, 2, None, None), actual[1])
+
+    def _load(self, db_file: Path, bulk: bool) -> list[tuple[object, ...]]:
+        engine = sa.create_engine(f"sqlite:///{db_file}")
+        with engine.begin() as sess:
+            sess.execute(sa.text(self.ddl))
+        if bulk:
+            index = "CREATE INDEX trip_zone ON trip (zone)"
+            with BulkLoader(engine, "trip", [index], batch_size=2) as loader:
+                loader.insert(self.df)
+            self.assertEqual(3, loader.rows)
+        else:
+            self.df.to_sql("trip", engine, if_exists="append", index=False)
+
+        with engine.begin() as sess:
+            rows = sess.execute(sa.text("SELECT * FROM trip ORDER BY id")).fetchall()
+        engine.dispose()
+        return list(map(tuple, rows))
@@ -0,0 +1,277 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Streaming, per-column statistical profile of the trip dataset.
+
+A single pass over the parquet, one record batch at a time, feeds small
+fixed-size sketches: moments, quantiles, and distinct counts.  So the whole
+dataset is profiled in seconds, in memory that does not grow with it.
+"""
+
+import html
+from collections import Counter
+from logging import getLogger
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from constant.ch02_taxi.jh.dataset import trip_dataset
+from constant.ch02_taxi.jh.features import COMPRESSED_DATASET
+from constant.util.logger import configure_logging
+from constant.util.path import temp_dir
+from constant.util.timing import timed
+
+PROFILE_HTML = temp_dir() / "constant/trip_profile.html"
+
+log = getLogger(__name__)
+
+
+class Moments:
+    """Count, mean and variance, merged batch by batch (Welford, per Chan et al.)."""
+
+    def __init__(self) -> None:
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
+
+    def update(self, values: np.ndarray) -> None:
+        n = len(values)
+        if n == 0:
+            return
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        delta = mean - self.mean
+        total = self.n + n
+        self.mean += delta * n / total
+        self.m2 += m2 + delta**2 * self.n * n / total
+        self.n = total
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else float("nan")
+
+
+class QuantileSketch:
+    """A KLL-style sketch, for approximate quantiles and histograms.
+
+    Compactors at each level hold at most K items.  When one overflows,
+    it is sorted and every other item, from a random offset, is promoted
+    to the next level, where each item stands for twice as many values.
+    Rank error is around 1 / K, and memory is K items per level,
+    i.e. logarithmic in the number of values seen.
+    """
+
+    def __init__(self, k: int = 4096, seed: int = 0) -> None:
+        self.k = k
+        self.levels: list[np.ndarray] = []
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values: np.ndarray) -> None:
+        self._add(0, np.asarray(values, dtype=float))
+
+    def _add(self, level: int, values: np.ndarray) -> None:
+        if len(self.levels) <= level:
+            self.levels.append(np.empty(0))
+        items = np.concatenate([self.levels[level], values])
+        if len(items) <= self.k:
+            self.levels[level] = items
+            return
+        items.sort()
+        n_even = len(items) - len(items) % 2
+        self.levels[level] = items[n_even:]  # an odd item out stays behind
+        self._add(level + 1, items[self.rng.integers(2) : n_even : 2])
+
+    def weighted_items(self) -> tuple[np.ndarray, np.ndarray]:
+        items = np.concatenate([np.empty(0), *self.levels])
+        weights = np.concatenate(
+            [np.empty(0)]
+            + [np.full(len(v), 2.0**h) for h, v in enumerate(self.levels)]
+        )
+        return items, weights
+
+    def quantiles(self, qs: list[float]) -> np.ndarray:
+        items, weights = self.weighted_items()
+        if len(items) == 0:
+            return np.full(len(qs), np.nan)
+        order = np.argsort(items)
+        cumulative = np.cumsum(weights[order])
+        ranks = np.asarray(qs) * cumulative[-1]
+        i = np.searchsorted(cumulative, ranks, side="left").clip(0, len(items) - 1)
+        return items[order][i]
+
+    def histogram(
+        self, bins: int = 40, trim: float = 0.01
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Returns approximate counts, over all but a TRIM fraction at either end."""
+        items, weights = self.weighted_items()
+        lo, hi = self.quantiles([trim, 1 - trim])
+        return np.histogram(items, bins, (lo, hi), weights=weights)
+
+
+class DistinctSketch:
+    """HyperLogLog estimate of the number of distinct values, within ~1%."""
+
+    def __init__(self, p: int = 14) -> None:
+        self.p = p
+        self.registers = np.zeros(2**p, dtype=np.uint8)
+
+    def update(self, hashes: np.ndarray) -> None:
+        """Accepts uint64 hashes, e.g. from pd.util.hash_array()."""
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64(2 ** (64 - self.p) - 1)
+        # Position of the leftmost 1 bit of the remaining 64 - p bits.
+        bit_length = np.frexp(rest.astype(float))[1]
+        rank = (64 - self.p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(2.0 ** -self.registers.astype(float))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)  # linear counting, for small cardinalities
+        return float(raw)
+
+
+class ColumnProfile:
+    """Accumulates the statistics of one column, from a stream of arrow arrays."""
+
+    def __init__(self, name: str, type_: pa.DataType) -> None:
+        self.name = name
+        self.type = type_
+        self.is_time = pa.types.is_timestamp(type_)
+        self.is_numeric = (
+            self.is_time or pa.types.is_integer(type_) or pa.types.is_floating(type_)
+        )
+        self.is_categorical = pa.types.is_dictionary(type_)
+        self.count = 0
+        self.nulls = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.moments = Moments()
+        self.quantiles = QuantileSketch()
+        self.distinct = DistinctSketch()
+        self.top: Counter[str] = Counter()
+
+    def update(self, array: pa.Array) -> None:
+        self.count += len(array)
+        self.nulls += array.null_count
+        array = pc.drop_null(array)
+        if self.is_categorical:
+            for item in pc.value_counts(array).to_pylist():
+                self.top[item["values"]] += item["counts"]
+            return
+        if not self.is_numeric:
+            values = array.to_numpy(zero_copy_only=False)
+            self.distinct.update(pd.util.hash_array(values))
+            return
+
+        values = array.to_numpy(zero_copy_only=False)
+        if self.is_time:
+            values = values.astype("datetime64[ns]").view(np.int64)
+        values = values[~np.isnan(values)] if values.dtype.kind == "f" else values
+        self.nulls += len(array) - len(values)
+        if len(values) == 0:
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.distinct.update(pd.util.hash_array(values))
+        values = values.astype(float)
+        self.moments.update(values)
+        self.quantiles.update(values)
+
+    def summary(self) -> dict[str, Any]:
+        d: dict[str, Any] = dict(
+            count=self.count,
+            null_rate=self.nulls / self.count if self.count else 0.0,
+        )
+        if self.is_categorical:
+            d["distinct"] = len(self.top)
+            d["top"] = self.top.most_common(5)
+            return d
+        d["distinct"] = round(self.distinct.estimate())
+        if self.is_numeric and self.moments.n:
+            q = self.quantiles.quantiles([0.01, 0.25, 0.5, 0.75, 0.99])
+            stats = dict(min=self.min, p01=q[0], p25=q[1], median=q[2], p75=q[3])
+            stats |= dict(p99=q[4], max=self.max, mean=self.moments.mean)
+            d |= {k: self._format(v) for k, v in stats.items()}
+            if not self.is_time:
+                d["std"] = self._format(np.sqrt(self.moments.variance))
+        return d
+
+    def _format(self, value: float) -> str:
+        if self.is_time:
+            return str(pd.Timestamp(int(value)).round("s"))
+        return f"{value:.6g}"
+
+
+@timed
+def profile_dataset(
+    in_file: Path = COMPRESSED_DATASET, batch_size: int = 128 * 1024
+) -> tuple[int, list[ColumnProfile]]:
+    """Returns the number of trips, and a profile of each column, in one pass."""
+    dataset = trip_dataset(in_file)
+    profiles = [ColumnProfile(field.name, field.type) for field in dataset.schema]
+    num_rows = 0
+    for batch in dataset.to_batches(batch_size=batch_size):
+        num_rows += batch.num_rows
+        for profile, array in zip(profiles, batch.columns):
+            profile.update(array)
+    return num_rows, profiles
+
+
+def render_html(num_rows: int, profiles: list[ColumnProfile], out_file: Path) -> None:
+    """Writes a self-contained report: a table of statistics, and histograms."""
+    sections = []
+    for profile in profiles:
+        rows = "".join(
+            f"<tr><th>{key}</th><td>{html.escape(str(value))}</td></tr>"
+            for key, value in profile.summary().items()
+        )
+        chart = _svg_histogram(profile) if profile.moments.n else ""
+        sections.append(
+            f"<section><h2>{html.escape(profile.name)}</h2>"
+            f"<p>{html.escape(str(profile.type))}</p>"
+            f"<table>{rows}</table>{chart}</section>"
+        )
+    out_file.write_text(
+        f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Trip profile</title>
+<style>
+  body {{ font-family: sans-serif; }}
+  section {{ display: inline-block; vertical-align: top; margin: 1em; }}
+  th {{ text-align: left; padding-right: 1em; }}
+  rect {{ fill: purple; }}
+</style></head>
+<body><h1>Profile of {num_rows:_} trips</h1>
+{"".join(sections)}
+</body></html>
+"""
+    )
+
+
+def _svg_histogram(profile: ColumnProfile, width: int = 240, height: int = 80) -> str:
+    counts, _ = profile.quantiles.histogram()
+    peak = counts.max(initial=0) or 1
+    bar = width / len(counts)
+    bars = "".join(
+        f'<rect x="{i * bar:.1f}" y="{height * (1 - c / peak):.1f}"'
+        f' width="{bar:.1f}" height="{height * c / peak:.1f}"/>'
+        for i, c in enumerate(counts)
+    )
+    return f'<svg width="{width}" height="{height}">{bars}</svg>'
+
+
+def main(in_file: Path = COMPRESSED_DATASET, out_file: Path = PROFILE_HTML) -> None:
+    num_rows, profiles = profile_dataset(in_file)
+    render_html(num_rows, profiles, out_file)
+    log.info(f"  profiled {num_rows:_} trips into {out_file}")
+
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
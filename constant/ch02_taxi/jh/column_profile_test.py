@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
+
+from constant.ch02_taxi.jh.column_profile import (
+    DistinctSketch,
+    Moments,
+    QuantileSketch,
+    profile_dataset,
+    render_html,
+)
+from constant.ch02_taxi.jh.dataset import TripDatasetWriter
+
+
+class SketchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.values = np.random.default_rng(0).lognormal(6, 1, 1_000_000)
+
+    def test_moments(self) -> None:
+        moments = Moments()
+        for batch in np.array_split(self.values, 7):
+            moments.update(batch)
+        self.assertEqual(len(self.values), moments.n)
+        self.assertAlmostEqual(1, moments.mean / self.values.mean(), places=12)
+        self.assertAlmostEqual(1, moments.variance / self.values.var(ddof=1), places=9)
+
+    def test_quantiles(self) -> None:
+        sketch = QuantileSketch()
+        for batch in np.array_split(self.values, 10):
+            sketch.update(batch)
+        qs = [0.01, 0.1, 0.5, 0.9, 0.99]
+        # Compare ranks, rather than values, as the tail is long.
+        ranks = np.searchsorted(np.sort(self.values), sketch.quantiles(qs))
+        np.testing.assert_allclose(qs, ranks / len(self.values), atol=0.005)
+        self.assertLess(sum(map(len, sketch.levels)), 50_000)
+
+    def test_distinct(self) -> None:
+        sketch = DistinctSketch()
+        self.assertEqual(0, sketch.estimate())
+        values = np.arange(200_000) % 150_000
+        sketch.update(pd.util.hash_array(values))
+        self.assertAlmostEqual(1, sketch.estimate() / 150_000, delta=0.02)
+
+        small = DistinctSketch()
+        small.update(pd.util.hash_array(np.array([3, 1, 4, 1, 5, 9, 2, 6])))
+        self.assertEqual(7, round(small.estimate()))
+
+
+class ProfileTest(unittest.TestCase):
+    def test_profile_dataset(self) -> None:
+        pickup = pd.date_range("2016-01-31 22:00", periods=6, freq="h")
+        df = pd.DataFrame(
+            {
+                "id": [f"id{i}" for i in range(6)],
+                "pickup_datetime": pickup,
+                "trip_duration": [60, 120, 180, 240, 300, 360],
+                "distance": [1.0, 2.0, np.nan, 4.0, 5.0, 6.0],
+                "pickup_zone": ["JFK Airport", None] + ["Midtown Center"] * 4,
+            }
+        )
+        with TemporaryDirectory() as temp:
+            dataset = Path(temp) / "trip.parquet"
+            with TripDatasetWriter(dataset) as writer:
+                writer.write(df)
+            num_rows, profiles = profile_dataset(dataset, batch_size=4)
+            out_file = Path(temp) / "profile.html"
+            render_html(num_rows, profiles, out_file)
+            page = out_file.read_text()
+            self.assertIn("<h2>pickup_zone</h2>", page)
+            self.assertIn("<p>dictionary&lt;values=string, indices=int16", page)
+
+        self.assertEqual(6, num_rows)
+        summary = {p.name: p.summary() for p in profiles}
+        self.assertEqual(6, summary["id"]["distinct"])
+        self.assertEqual("60", summary["trip_duration"]["min"])
+        self.assertEqual("210", summary["trip_duration"]["mean"])
+        self.assertEqual(1 / 6, summary["distance"]["null_rate"])
+        self.assertEqual("3.6", summary["distance"]["mean"])
+        self.assertEqual(
+            [("Midtown Center", 4), ("JFK Airport", 1)], summary["pickup_zone"]["top"]
+        )
+        self.assertEqual("2016-02-01 03:00:00", summary["pickup_datetime"]["max"])
+        self.assertEqual(2, summary["pickup_month"]["distinct"])
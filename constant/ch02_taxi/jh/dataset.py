@@ -0,0 +1,257 @@
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Compact, partitioned parquet storage of the trip dataset."""
+
+import operator
+import os
+import shutil
+from collections.abc import Iterable
+from functools import reduce
+from pathlib import Path
+from tempfile import mkdtemp
+from types import TracebackType
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from constant.ch02_taxi.jh.features import COMPRESSED_DATASET
+from constant.util.path import atomic_write
+from constant.util.timing import timed
+
+_ZONE = pa.dictionary(pa.int16(), pa.string())
+
+# Narrow types: float32 locates a point to within a meter, for instance.
+TRIP_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("pickup_datetime", pa.timestamp("ns")),
+        ("dropoff_datetime", pa.timestamp("ns")),
+        ("passenger_count", pa.int8()),
+        ("pickup_longitude", pa.float32()),
+        ("pickup_latitude", pa.float32()),
+        ("dropoff_longitude", pa.float32()),
+        ("dropoff_latitude", pa.float32()),
+        ("trip_duration", pa.int32()),
+        ("distance", pa.float32()),
+        ("direction", pa.int16()),
+        ("dow", pa.int8()),
+        ("hour", pa.int8()),
+        ("pickup_borough", _ZONE),
+        ("pickup_zone", _ZONE),
+        ("dropoff_borough", _ZONE),
+        ("dropoff_zone", _ZONE),
+    ]
+)
+
+PICKUP_MONTH = "pickup_month"  # e.g. "2016-03"
+
+
+def to_arrow(df: pd.DataFrame, schema: pa.Schema = TRIP_SCHEMA) -> pa.Table:
+    """Converts trips to the compact SCHEMA, keeping any columns it does not mention."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fields = [
+        schema.field(name) if name in schema.names else table.schema.field(name)
+        for name in table.column_names
+    ]
+    return table.cast(pa.schema(fields), safe=False)
+
+
+class TripDatasetWriter:
+    """Writes chunks of trips to a parquet dataset, optionally hive-partitioned.
+
+    When partitioned by PICKUP_MONTH, the output is a directory holding a file
+    per month, e.g. trip.parquet/pickup_month=2016-03/part-0.parquet, so that
+    readers can skip whole months.  Each chunk is sorted by pickup time, which
+    tightens the min / max statistics of each row group.
+
+    Chunks go to a temp directory beside PATH, which replaces any earlier
+    dataset only on a clean exit, so a failed run leaves the last good one.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        partition_by: str | None = PICKUP_MONTH,
+        compression: str = "zstd",
+        row_group_size: int = 128 * 1024,
+    ) -> None:
+        assert partition_by in (None, PICKUP_MONTH), partition_by
+        self.path = path
+        self.partition_by = partition_by
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self.writers: dict[str, pq.ParquetWriter] = {}
+
+    def __enter__(self) -> "TripDatasetWriter":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        prefix = f".{self.path.name}-"
+        self.work_dir = Path(
+            mkdtemp(prefix=prefix, suffix=".tmp", dir=self.path.parent)
+        )
+        self.out_path = self.work_dir / self.path.name
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        try:
+            for writer in self.writers.values():
+                writer.close()
+            if exc_type is None:
+                self._replace()
+        finally:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _replace(self) -> None:
+        # Two renames, each atomic, so neither dataset is ever seen half written.
+        if self.path.exists():
+            os.replace(self.path, self.work_dir / "previous")
+        if self.out_path.exists():
+            os.replace(self.out_path, self.path)
+
+    def write(self, df: pd.DataFrame) -> None:
+        df = df.sort_values("pickup_datetime", kind="stable")
+        if self.partition_by is None:
+            self._write(self.out_path, to_arrow(df))
+            return
+
+        months = df.pickup_datetime.dt.strftime("%Y-%m")
+        for month, part in df.groupby(months.to_numpy(), sort=True):
+            out_file = self.out_path / f"{self.partition_by}={month}/part-0.parquet"
+            self._write(out_file, to_arrow(part))
+
+    def _write(self, out_file: Path, table: pa.Table) -> None:
+        key = str(out_file)
+        if key not in self.writers:
+            out_file.parent.mkdir(parents=True, exist_ok=True)
+            self.writers[key] = pq.ParquetWriter(
+                out_file, table.schema, compression=self.compression
+            )
+        self.writers[key].write_table(table, row_group_size=self.row_group_size)
+
+
+BBox = tuple[float, float, float, float]  # west, south, east, north, like shapely
+
+
+@timed
+def load_trips(
+    columns: list[str] | None = None,
+    where: ds.Expression | None = None,
+    limit: int | None = None,
+    sample: float | None = None,
+    bbox: BBox | None = None,
+    duration: tuple[int | None, int | None] | None = None,
+    hours: int | Iterable[int] | None = None,
+    in_file: Path = COMPRESSED_DATASET,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Reads just the trips, and the COLUMNS, that a caller asked for.
+
+    The filters are pushed down into the parquet scan, so row groups whose
+    statistics rule them out, and months outside a pickup_month predicate,
+    are never decompressed.  WHERE is an arbitrary pyarrow expression,
+    e.g. ds.field("pickup_month") == "2016-03".  Trips must start and end
+    within BBOX, take from DURATION[0] up to DURATION[1] seconds,
+    and begin in one of the given HOURS.  A SAMPLE fraction of the matching
+    trips is kept, chosen at random, and the scan stops after LIMIT rows.
+    """
+    filters = [] if where is None else [where]
+    if bbox:
+        filters += [in_bbox(bbox, "pickup"), in_bbox(bbox, "dropoff")]
+    lo, hi = duration or (None, None)
+    if lo is not None:
+        filters.append(ds.field("trip_duration") >= lo)
+    if hi is not None:
+        filters.append(ds.field("trip_duration") < hi)
+    if hours is not None:
+        hours = [hours] if isinstance(hours, int) else list(hours)
+        filters.append(ds.field("hour").isin(hours))
+
+    scanner = trip_dataset(in_file).scanner(
+        columns=columns,
+        filter=_conjunction(filters),
+    )
+    if sample is None:
+        table = scanner.to_table() if limit is None else scanner.head(limit)
+        return table.to_pandas()
+
+    rng = np.random.default_rng(seed)
+    batches, num_rows = [], 0
+    for batch in scanner.to_batches():
+        batch = batch.filter(pa.array(rng.random(batch.num_rows) < sample))
+        batches.append(batch)
+        num_rows += batch.num_rows
+        if limit is not None and num_rows >= limit:
+            break
+    table = pa.Table.from_batches(batches, scanner.projected_schema)
+    return table.slice(0, limit).to_pandas()
+
+
+def snapshot_file(in_file: Path = COMPRESSED_DATASET) -> Path:
+    return in_file.with_suffix(".arrow")
+
+
+def write_snapshot(in_file: Path = COMPRESSED_DATASET) -> Path:
+    """Copies the dataset to an uncompressed Arrow IPC (Feather v2) snapshot.
+
+    The snapshot holds a single record batch, with each zone column sharing
+    one dictionary, so that read_snapshot() can map every column zero-copy.
+    The compact table is briefly held in memory while it is written.
+    """
+    out_file = snapshot_file(in_file)
+    table = trip_dataset(in_file).to_table().unify_dictionaries().combine_chunks()
+    with atomic_write(out_file) as temp_file:
+        with pa.OSFile(str(temp_file), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+    return out_file
+
+
+def read_snapshot(
+    in_file: Path | None = None,
+    columns: list[str] | None = None,
+    limit: int | None = None,
+) -> pd.DataFrame:
+    """Memory-maps a snapshot, so startup costs neither decompression nor a copy.
+
+    Numeric columns are read-only views of the OS page cache,
+    which concurrent processes reading the same snapshot all share.
+    """
+    in_file = in_file or snapshot_file()
+    table = pa.ipc.open_file(pa.memory_map(str(in_file))).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    if limit is not None:
+        table = table.slice(0, limit)
+    return table.to_pandas(split_blocks=True)
+
+
+def is_fresh(snapshot: Path, in_file: Path = COMPRESSED_DATASET) -> bool:
+    """Predicate: the snapshot is newer than every file of the dataset."""
+    if not snapshot.exists():
+        return False
+    files = in_file.glob("**/*.parquet") if in_file.is_dir() else [in_file]
+    mtime = snapshot.stat().st_mtime
+    return all(file.stat().st_mtime <= mtime for file in files)
+
+
+def trip_dataset(in_file: Path = COMPRESSED_DATASET) -> ds.Dataset:
+    partitioning = ds.HivePartitioning.discover(infer_dictionary=True)
+    return ds.dataset(in_file, format="parquet", partitioning=partitioning)
+
+
+def in_bbox(bbox: BBox, end: str = "dropoff") -> ds.Expression:
+    """Selects trips whose pickup or dropoff END lies strictly within BBOX."""
+    west, south, east, north = bbox
+    lng = ds.field(f"{end}_longitude")
+    lat = ds.field(f"{end}_latitude")
+    return (west < lng) & (lng < east) & (south < lat) & (lat < north)
+
+
+def _conjunction(filters: list[ds.Expression]) -> ds.Expression | None:
+    return reduce(operator.and_, filters) if filters else None
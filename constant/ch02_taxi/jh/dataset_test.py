@@ -0,0 +1,127 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+from constant.ch02_taxi.jh.dataset import (
+    TripDatasetWriter,
+    in_bbox,
+    is_fresh,
+    load_trips,
+    read_snapshot,
+    snapshot_file,
+    to_arrow,
+    write_snapshot,
+)
+from constant.ch02_taxi.jh.features import add_pickup_dow_hour
+
+
+class DatasetTest(unittest.TestCase):
+    def setUp(self) -> None:
+        pickup = pd.to_datetime(["2016-02-01 09:00", "2016-01-31 23:00"])
+        self.df = pd.DataFrame(
+            {
+                "pickup_datetime": pickup,
+                "pickup_latitude": [40.752, 40.64],
+                "hour": pickup.hour,
+                "pickup_zone": [None, None],  # no match, in this chunk
+            }
+        )
+
+    def test_to_arrow(self) -> None:
+        schema = to_arrow(self.df).schema
+        self.assertEqual("float", str(schema.field("pickup_latitude").type))
+        self.assertEqual("int8", str(schema.field("hour").type))
+        self.assertEqual("int16", str(schema.field("pickup_zone").type.index_type))
+
+    def test_partitioned_write(self) -> None:
+        with TemporaryDirectory() as temp:
+            path = Path(temp) / "trip.parquet"
+            with TripDatasetWriter(path) as writer:
+                writer.write(self.df)
+                writer.write(self.df)
+
+            months = sorted(p.name for p in path.glob("*"))
+            self.assertEqual(["pickup_month=2016-01", "pickup_month=2016-02"], months)
+            df = pd.read_parquet(path)
+            self.assertEqual([23, 23, 9, 9], list(df.hour))
+            self.assertEqual(
+                ["2016-01", "2016-02"], list(df.pickup_month.cat.categories)
+            )
+
+    def test_failed_write(self) -> None:
+        with TemporaryDirectory() as temp:
+            path = Path(temp) / "trip.parquet"
+            with TripDatasetWriter(path, partition_by=None) as writer:
+                writer.write(self.df)
+            with self.assertRaises(ValueError):
+                with TripDatasetWriter(path, partition_by=None) as writer:
+                    writer.write(self.df.assign(hour=7))
+                    raise ValueError  # e.g. a later chunk fails to transform
+            self.assertEqual([23, 9], list(pd.read_parquet(path).hour))
+            self.assertEqual(["trip.parquet"], [p.name for p in Path(temp).iterdir()])
+
+            with TripDatasetWriter(path) as writer:  # partitioned, over a file
+                writer.write(self.df.assign(hour=7))
+            self.assertEqual([7, 7], list(pd.read_parquet(path).hour))
+            self.assertEqual(["trip.parquet"], [p.name for p in Path(temp).iterdir()])
+
+    def test_load_trips(self) -> None:
+        pickup = pd.date_range("2016-01-31", periods=48, freq="h")
+        df = pd.DataFrame(
+            {
+                "pickup_datetime": pickup,
+                "dropoff_longitude": -73.98 + 0.01 * (pickup.hour % 2),
+                "dropoff_latitude": 40.75,
+                "trip_duration": range(0, 480, 10),
+                "hour": pickup.hour,
+            }
+        )
+        with TemporaryDirectory() as temp:
+            path = Path(temp) / "trip.parquet"
+            with TripDatasetWriter(path) as writer:
+                writer.write(df)
+
+            january = ds.field("pickup_month") == "2016-01"
+            df = load_trips(["hour"], january, in_file=path)
+            self.assertEqual(list(range(24)), list(df.hour))
+            self.assertEqual(["hour"], list(df.columns))
+
+            self.assertEqual(5, len(load_trips(limit=5, in_file=path)))
+            self.assertEqual([6, 6], list(load_trips(hours=6, in_file=path).hour))
+            df = load_trips(duration=(100, 200), in_file=path)
+            self.assertEqual(list(range(100, 200, 10)), list(df.trip_duration))
+
+            bbox = (-73.99, 40.7, -73.975, 40.8)  # excludes odd hours
+            df = load_trips(where=in_bbox(bbox), in_file=path)
+            self.assertEqual({0}, set(df.hour % 2))
+
+            df = load_trips(sample=0.5, in_file=path)
+            self.assertLess(0, len(df))
+            self.assertGreater(48, len(df))
+
+    def test_snapshot(self) -> None:
+        with TemporaryDirectory() as temp:
+            path = Path(temp) / "trip.parquet"
+            with TripDatasetWriter(path) as writer:
+                writer.write(self.df)
+                writer.write(self.df.assign(pickup_zone="Midtown Center"))
+            self.assertFalse(is_fresh(snapshot_file(path), path))
+
+            snapshot = write_snapshot(path)
+            self.assertTrue(is_fresh(snapshot, path))
+            df = read_snapshot(snapshot)
+            pd.testing.assert_frame_equal(load_trips(in_file=path), df)
+            self.assertFalse(df.pickup_latitude.to_numpy().flags.writeable)  # mapped
+
+            df = add_pickup_dow_hour(df)  # replaces the read-only hour column
+            self.assertEqual([23, 23, 9, 9], list(df.hour))
+            self.assertEqual([6, 6, 0, 0], list(df.dow))
+
+            df = read_snapshot(snapshot, ["hour"], limit=3)
+            self.assertEqual([23, 23, 9], list(df.hour))
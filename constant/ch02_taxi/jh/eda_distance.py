@@ -8,12 +8,16 @@ import pandas as pd
 import seaborn as sns
 from matplotlib.axes import Axes
 
-from constant.ch02_taxi.jh.etl import discard_outlier_rows
+from constant.ch02_taxi.jh.aggregates import min_elapsed_by_distance
+from constant.ch02_taxi.jh.etl import discard_outlier_rows, load_clean_trips
 from constant.ch02_taxi.jh.features import COMPRESSED_DATASET, add_pickup_dow_hour
+from constant.util.logger import configure_logging
+from constant.util.timing import timed
 
 MAX_ELAPSED = 125 * 60  # 125 minutes, ~ two hours
 
 
+@timed
 def eda_distance(df: pd.DataFrame, ax: Axes, num_rows: int = 100_000) -> None:
     df = discard_outlier_rows(df)[:num_rows]
     df = add_pickup_dow_hour(df)
@@ -28,9 +32,10 @@ def eda_distance(df: pd.DataFrame, ax: Axes, num_rows: int = 100_000) -> None:
     ax.set_ylim(0, MAX_ELAPSED)
 
 
-def eda_min_time(df: pd.DataFrame, ax: Axes) -> None:
-    df["distance_km"] = (df.distance / 1000).apply(int)
-    df = df.groupby("distance_km").elapsed.min().reset_index()
+@timed
+def eda_min_time(ax: Axes, in_file: Path = COMPRESSED_DATASET) -> None:
+    """Plots the quickest trip of each distance, over all trips."""
+    df = min_elapsed_by_distance(in_file=in_file)
 
     # 13.3 m/s is 30 mph
     sns.regplot(
@@ -46,14 +51,16 @@ def eda_min_time(df: pd.DataFrame, ax: Axes) -> None:
 
 
 def main(in_file: Path = COMPRESSED_DATASET, num_rows: int = 100_000) -> None:
-    df = pd.read_parquet(in_file)[:num_rows]
-    df = discard_outlier_rows(df)
+    columns = ["pickup_datetime", "distance", "trip_duration"]
+    df = load_clean_trips(columns, limit=num_rows, in_file=in_file)
+    df["elapsed"] = df.trip_duration
     df = add_pickup_dow_hour(df)
     _, axes = plt.subplots(1, 2)
 
     eda_distance(df, axes[0])
-    eda_min_time(df, axes[1])
+    eda_min_time(axes[1], in_file)
 
 
 if __name__ == "__main__":
+    configure_logging()
     main()
@@ -5,41 +5,44 @@ from pathlib import Path
 
 import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
 from beartype import beartype
 
-from constant.ch02_taxi.jh.etl import discard_outlier_rows
+from constant.ch02_taxi.jh.etl import discard_outlier_rows, load_clean_trips
 from constant.ch02_taxi.jh.features import COMPRESSED_DATASET, add_pickup_dow_hour
+from constant.ch02_taxi.jh.raster import data_bbox, density, show_density
+from constant.util.logger import configure_logging
+from constant.util.timing import timed
 
 
+@timed
 @beartype
-def eda_map(df: pd.DataFrame, num_rows: int = 100_000) -> None:
+def eda_map(df: pd.DataFrame, num_rows: int | None = None) -> None:
     df = discard_outlier_rows(df)[:num_rows]
     df = add_pickup_dow_hour(df)
     show_trip_locations(df)
 
 
+@timed
 @beartype
-def show_trip_locations(df: pd.DataFrame) -> None:
-    fig, _ = plt.subplots()
+def show_trip_locations(
+    df: pd.DataFrame, end: str = "dropoff", log: bool = True
+) -> None:
+    """Shows a density raster of every pickup or dropoff location."""
+    lng = df[f"{end}_longitude"].to_numpy()
+    lat = df[f"{end}_latitude"].to_numpy()
+    bbox = data_bbox(lng, lat)
+    fig, ax = plt.subplots()
     assert fig
-    sns.scatterplot(
-        data=df,
-        # x="pickup_longitude",
-        # y="pickup_latitude",
-        x="dropoff_longitude",
-        y="dropoff_latitude",
-        size=2,
-        alpha=0.02,
-        color="purple",
-    )
+    show_density(ax, density(lng, lat, bbox), bbox, log)
     plt.show()
 
 
 @beartype
-def main(in_file: Path = COMPRESSED_DATASET) -> None:
-    eda_map(pd.read_parquet(in_file))
+def main(in_file: Path = COMPRESSED_DATASET, num_rows: int | None = None) -> None:
+    columns = ["pickup_datetime", "dropoff_longitude", "dropoff_latitude"]
+    eda_map(load_clean_trips(columns, limit=num_rows, in_file=in_file), num_rows)
 
 
 if __name__ == "__main__":
+    configure_logging()
     main()
@@ -6,11 +6,15 @@ from pathlib import Path
 
 import matplotlib.figure as mpfig
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import seaborn as sns
 import streamlit as st
 
+from constant.ch02_taxi.jh.aggregates import trip_counts
+from constant.ch02_taxi.jh.dataset import BBox
 from constant.ch02_taxi.jh.features import COMPRESSED_DATASET
+from constant.ch02_taxi.jh.raster import show_density
+from constant.ch02_taxi.jh.tile_cube import load_cube
 
 warnings.filterwarnings(
     "ignore",
@@ -18,45 +22,47 @@ warnings.filterwarnings(
 )
 
 
-@st.cache_data
-def _tight_bbox(df: pd.DataFrame) -> pd.DataFrame:
-    return df[
-        True
-        & (-74.05 < df.dropoff_longitude)
-        & (df.dropoff_longitude < -73.8)
-        & (40.7 < df.dropoff_latitude)
-        & (df.dropoff_latitude < 40.85)
-    ]
+DAYS = ["all", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
 
 
-def eda_time(df: pd.DataFrame, num_rows: int = 200_000) -> None:
-    df = _tight_bbox(df)[:num_rows]
-    show_dropoff_locations(df)
+@st.cache_resource
+def _load_cube(in_file: Path) -> tuple[np.ndarray, BBox]:
+    """Loads the precomputed cube once per server, shared by every session."""
+    return load_cube(dataset=in_file)
 
 
-def show_dropoff_locations(df: pd.DataFrame) -> None:
+def show_dropoff_locations(counts: np.ndarray, bbox: BBox) -> None:
+    """Maps the dropoffs of an hour, on any day or on one day-of-week."""
     display_hour = st.slider("hour", 0, 23, 6)
-    st.write(_plot_fig(df[df.hour == display_hour]))
+    day = st.select_slider("day", DAYS)
+    if day == "all":
+        grid = counts[display_hour].sum(axis=0)
+    else:
+        grid = counts[display_hour, DAYS.index(day) - 1]  # Monday=0
+    st.write(_plot_fig(grid, bbox))
 
 
 @st.cache_data
-def _plot_fig(df: pd.DataFrame) -> mpfig.Figure:
+def _plot_fig(grid: np.ndarray, bbox: BBox) -> mpfig.Figure:
     fig, ax = plt.subplots()
-    sns.scatterplot(
-        data=df,
-        x="dropoff_longitude",
-        y="dropoff_latitude",
-        size=2,
-        alpha=0.08,
-        color="purple",
-    )
-    ax.set_xlim(df.dropoff_longitude.min(), df.dropoff_longitude.max())
-    ax.set_ylim(df.dropoff_latitude.min(), df.dropoff_latitude.max())
+    show_density(ax, grid, bbox)
     return fig
 
 
+def show_hourly_counts(in_file: Path = COMPRESSED_DATASET) -> None:
+    """Charts trips per hour, over all trips, aggregated by DuckDB."""
+    st.bar_chart(_hourly_counts(in_file, in_file.stat().st_mtime))
+
+
+@st.cache_data
+def _hourly_counts(in_file: Path, mtime: float) -> pd.DataFrame:
+    # Scans each version of the dataset once, rather than on every rerun.
+    return trip_counts(("hour",), in_file).set_index("hour")
+
+
 def main(in_file: Path = COMPRESSED_DATASET) -> None:
-    eda_time(pd.read_parquet(in_file))
+    show_hourly_counts(in_file)
+    show_dropoff_locations(*_load_cube(in_file))
 
 
 if __name__ == "__main__":
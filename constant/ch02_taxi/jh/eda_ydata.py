@@ -4,9 +4,12 @@
 import warnings
 from pathlib import Path
 
-import pandas as pd
-from ydata_profiling import ProfileReport
-
+from constant.ch02_taxi.jh.column_profile import (
+    PROFILE_HTML,
+    profile_dataset,
+    render_html,
+)
+from constant.ch02_taxi.jh.dataset import TRIP_SCHEMA, load_trips
 from constant.ch02_taxi.jh.features import COMPRESSED_DATASET
 
 warnings.filterwarnings(
@@ -23,8 +26,26 @@ warnings.filterwarnings(
 )
 
 
-def main(in_file: Path = COMPRESSED_DATASET) -> None:
-    df = pd.read_parquet(in_file)[:10_000]
+def main(
+    in_file: Path = COMPRESSED_DATASET,
+    out_file: Path = PROFILE_HTML,
+    ydata_rows: int = 0,
+) -> None:
+    """Profiles every trip, and optionally a ydata_profiling report of a few rows.
+
+    The streaming profile covers the full dataset in seconds.  The far slower
+    ydata report, of the first YDATA_ROWS trips, adds correlations and the like.
+    """
+    num_rows, profiles = profile_dataset(in_file)
+    render_html(num_rows, profiles, out_file)
+    print(f"Profiled {num_rows:_} trips into {out_file}")
+    if ydata_rows:
+        ydata_report(in_file, ydata_rows)
+
+
+def ydata_report(in_file: Path = COMPRESSED_DATASET, num_rows: int = 10_000) -> None:
+    from ydata_profiling import ProfileReport  # deferred, as it is slow to import
+
     drops = [
         "pickup_datetime",
         "dropoff_datetime",
@@ -34,7 +55,8 @@ def main(in_file: Path = COMPRESSED_DATASET) -> None:
         "dropoff_longitude",
         "dropoff_latitude",
     ]
-    df = df.drop(columns=drops)
+    columns = [col for col in TRIP_SCHEMA.names if col not in drops]
+    df = load_trips(columns, limit=num_rows, in_file=in_file)
     print(df.describe())
     print(df)
     ProfileReport(df).to_file("/tmp/k/trip.html")
@@ -3,34 +3,84 @@
 
 
 import re
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import cache, partial
+from logging import getLogger
+from multiprocessing import get_context
 from pathlib import Path
-from typing import Any, Callable
+from typing import TYPE_CHECKING, Any, Callable, Generator, Iterable
 
+import numpy as np
 import pandas as pd
 import sqlalchemy as sa
 import typer
-from geopy.distance import distance
 from ruamel.yaml import YAML
 
+from constant.ch02_taxi.jh.bulk_load import BulkLoader
+from constant.ch02_taxi.jh.dataset import (
+    PICKUP_MONTH,
+    TripDatasetWriter,
+    is_fresh,
+    load_trips,
+    read_snapshot,
+    snapshot_file,
+    write_snapshot,
+)
 from constant.ch02_taxi.jh.features import (
     COMPRESSED_DATASET,
+    TLC_ZONE_SHAPEFILE,
     add_direction,
     add_pickup_dow_hour,
     add_tlc_zone,
     grand_central_nyc,
 )
+from constant.ch02_taxi.jh.stage_cache import Stage, StageCache
+from constant.util.logger import configure_logging, init_worker_logging, log_queue
 from constant.util.path import constant, temp_dir
 from constant.util.timing import timed
 
+if TYPE_CHECKING:
+    from constant.ch02_taxi.jh.zones import TlcZoneIndex
+
 CONFIG_FILE = constant() / "ch02_taxi/jh/taxi.yml"
+LONG_TRIPS_CSV = temp_dir() / "constant/outlier_long_trips.csv"
+
+log = getLogger(__name__)
 
 
 class Etl:
-    """Extract, transform, and load Kaggle taxi data into a SQLite trip table."""
+    """Extract, transform, and load Kaggle taxi data into a SQLite trip table.
 
-    def __init__(self, db_file: Path, decorator: Callable[[Any], Any] = timed) -> None:
+    The trips are also written to a parquet DATASET.  ZONES defaults to the
+    TLC's own, from tlc_zone_index(), and a caller's own are never cached.
+    """
+
+    def __init__(
+        self,
+        db_file: Path,
+        decorator: Callable[[Any], Any] = timed,
+        cache: StageCache | None = None,
+        partition_by: str | None = PICKUP_MONTH,
+        compression: str = "zstd",
+        row_group_size: int = 128 * 1024,
+        snapshot: bool = False,
+        dataset: Path = COMPRESSED_DATASET,
+        long_trips_csv: Path = LONG_TRIPS_CSV,
+        zones: "TlcZoneIndex | None" = None,
+    ) -> None:
         self.folder = db_file.parent.resolve()
         self.engine = sa.create_engine(f"sqlite:///{db_file}", echo=False)
+        self.cache = cache
+        self.snapshot = snapshot
+        self.dataset = dataset
+        self.long_trips_csv = long_trips_csv
+        self.zones = zones
+        self.parquet_options = dict(
+            partition_by=partition_by,
+            compression=compression,
+            row_group_size=row_group_size,
+        )
 
         for method_name in dir(self) + dir(Etl):
             attr = getattr(self, method_name)
@@ -38,36 +88,128 @@ class Etl:
                 wrapped = decorator(attr)
                 setattr(self, method_name, wrapped)
 
-    def create_table(self, in_csv: Path) -> None:
-        date_cols = ["pickup_datetime", "dropoff_datetime"]
-        df = pd.read_csv(in_csv, parse_dates=date_cols)
-        df = self._discard_unhelpful_columns(df)
-        df["distance"] = 0.0
-        self._find_distance(df)  # This costs 6 minutes for 1.46 M rows (4200 row/sec)
-        df = discard_outlier_rows(df)
-        df = add_direction(df)
-        df = add_pickup_dow_hour(df)
-        df.to_parquet(COMPRESSED_DATASET, index=False)  #  JIC -- will overwrite later
-        df = add_tlc_zone(df)
-
-        one_second = "1s"  # trim meaningless milliseconds from observations
-        for col in date_cols:
-            df[col] = df[col].dt.round(one_second)
+    def create_table(
+        self, in_csv: Path, chunksize: int | None = None, workers: int = 1
+    ) -> None:
+        """Transforms IN_CSV into the trip table and the parquet dataset.
 
+        Given a CHUNKSIZE, the CSV streams through the transforms that many rows
+        at a time, so peak memory stays flat no matter how big the input is.
+        With several WORKERS, chunks are transformed in parallel processes,
+        and the output is identical to that of a serial run.
+        Optionally an Arrow snapshot of the dataset is written, as well.
+        """
         with self.engine.begin() as sess:
             sess.execute(sa.text("DROP TABLE  IF EXISTS  trip"))
             sess.execute(self.ddl)
-        df = df.drop(columns=["pickup_pt", "dropoff_pt"])
-        print(df)
-        df.to_sql("trip", self.engine, if_exists="append", index=False)
 
-        df.to_parquet(COMPRESSED_DATASET, index=False)
+        with (
+            TripDatasetWriter(self.dataset, **self.parquet_options) as writer,
+            BulkLoader(self.engine, "trip", self.post_load_sql) as loader,
+        ):
+            chunks = (
+                self._discard_unhelpful_columns(df, append=i > 0)
+                for i, df in enumerate(self._read_csv(in_csv, chunksize))
+            )
+            transformed = self._transform_all(
+                chunks, chunksize, workers, self.cache, self.zones
+            )
+            for i, df in enumerate(transformed):
+                log.info(
+                    f"  chunk {i}: {len(df):_} trips",
+                    extra=dict(stage="transform", chunk=i, rows=len(df)),
+                )
+                writer.write(df)
+                loader.insert(df)
+
+        if self.snapshot:
+            write_snapshot(self.dataset)
 
         # self._write_yaml_bbox(df)
 
-    def _discard_unhelpful_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+    date_cols = ["pickup_datetime", "dropoff_datetime"]
+
+    @classmethod
+    def _read_csv(
+        cls, in_csv: Path, chunksize: int | None
+    ) -> Generator[pd.DataFrame, None, None]:
+        if chunksize is None:
+            yield pd.read_csv(in_csv, parse_dates=cls.date_cols)
+            return
+        with pd.read_csv(in_csv, parse_dates=cls.date_cols, chunksize=chunksize) as rdr:
+            yield from rdr
+
+    @classmethod
+    def _transform_all(
+        cls,
+        chunks: Iterable[pd.DataFrame],
+        chunksize: int | None,
+        workers: int,
+        cache: StageCache | None,
+        zones: "TlcZoneIndex | None" = None,
+    ) -> Generator[pd.DataFrame, None, None]:
+        """Yields transformed chunks, in their original order."""
+        if workers == 1:
+            yield from map(partial(cls._transform, cache=cache, zones=zones), chunks)
+            return
+
+        transform = partial(_transform_in_worker, cache=cache)
+        with ProcessPoolExecutor(
+            workers,
+            mp_context=get_context("spawn"),  # the log listener thread makes fork unsafe
+            initializer=_init_worker,
+            initargs=(log_queue(), zones),
+        ) as pool:
+            if chunksize is None:
+                # Split the whole frame into row ranges, and then glue them back.
+                (df,) = chunks
+                bounds = np.linspace(0, len(df), workers + 1).astype(int)
+                parts = [df.iloc[lo:hi] for lo, hi in zip(bounds, bounds[1:])]
+                yield pd.concat(pool.map(transform, parts))
+                return
+
+            pending: deque[Future[pd.DataFrame]] = deque()
+            for df in chunks:
+                pending.append(pool.submit(transform, df))
+                if len(pending) >= 2 * workers:  # bounds the memory in flight
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    @classmethod
+    def _transform(
+        cls,
+        df: pd.DataFrame,
+        cache: StageCache | None = None,
+        zones: "TlcZoneIndex | None" = None,
+    ) -> pd.DataFrame:
+        def stage(func: Stage, df: pd.DataFrame, *depends_on: Path) -> pd.DataFrame:
+            return cache.apply(func, df, *depends_on) if cache else func(df)
+
+        df = discard_outlier_rows(df)
+        df = stage(cls._add_direction_and_distance, df)  # About 2 s for 1.46 M rows
+        df = stage(add_pickup_dow_hour, df)
+        if zones is None:
+            df = stage(add_tlc_zone, df, TLC_ZONE_SHAPEFILE)
+        else:  # The cache key could not cover a caller's own zones.
+            df = add_tlc_zone(df, zones)
+
+        one_second = "1s"  # trim meaningless milliseconds from observations
+        for col in cls.date_cols:
+            df[col] = df[col].dt.round(one_second)
+        return df
+
+    def _discard_unhelpful_columns(
+        self, df: pd.DataFrame, append: bool = False
+    ) -> pd.DataFrame:
+        # Outliers are noted here, rather than by discard_outlier_rows() in workers.
+        mode, header = ("a", False) if append else ("w", True)
         delayed = _round(df[df.store_and_fwd_flag == "Y"])
-        delayed.to_csv(self.folder / "outlier_delayed.csv", index=False)
+        delayed.to_csv(
+            self.folder / "outlier_delayed.csv", index=False, mode=mode, header=header
+        )
+        long_trips = _round(df[df.trip_duration >= OutlierFilter.FOUR_HOURS])
+        long_trips.to_csv(self.long_trips_csv, index=False, mode=mode, header=header)
 
         df = df.drop(columns=["vendor_id"])  # TPEP: Creative Mobile or Verifone
         df = df.drop(columns=["store_and_fwd_flag"])  # only Y when out-of-range
@@ -98,17 +240,19 @@ class Etl:
     """
     )
 
-    @classmethod
-    def _distance(cls, row: pd.Series) -> float:
-        from_ = row.pickup_latitude, row.pickup_longitude
-        to = row.dropoff_latitude, row.dropoff_longitude
-        meters: float = distance(from_, to).m
-        return round(meters, 2)
+    # Run once the trip table is fully loaded, as indexes are cheaper to build then.
+    # They serve the constant.ch02_taxi.jh.queries module.
+    post_load_sql = [
+        "CREATE INDEX trip_pickup_datetime  ON trip (pickup_datetime)",
+        "CREATE INDEX trip_dow_hour  ON trip (dow, hour)",
+        "CREATE INDEX trip_zone_pair  ON trip (pickup_zone, dropoff_zone, pickup_datetime)",
+        "ANALYZE trip",
+    ]
 
     @classmethod
-    def _find_distance(cls, df: pd.DataFrame) -> pd.DataFrame:
-        df["distance"] = df.apply(lambda row: cls._distance(row), axis=1)
-        return df
+    def _add_direction_and_distance(cls, df: pd.DataFrame) -> pd.DataFrame:
+        # A single geodesic pass yields both, agreeing with featurize()'s to 1 cm.
+        return add_direction(df, with_distance=True)
 
     # Discard distant locations, e.g. the Verifone / Automation Anywhere
     # meter service center in San Jose, CA, locations in the North Atlantic.
@@ -145,6 +289,24 @@ class Etl:
         return ul, lr
 
 
+_worker_zones: "TlcZoneIndex | None" = None
+
+
+def _init_worker(queue: Any, zones: "TlcZoneIndex | None") -> None:
+    # Each worker gets the zones once, rather than pickled along with every chunk.
+    global _worker_zones
+    init_worker_logging(queue)
+    _worker_zones = zones
+    if zones is None:
+        from constant.ch02_taxi.jh.zones import tlc_zone_index
+
+        tlc_zone_index()
+
+
+def _transform_in_worker(df: pd.DataFrame, cache: StageCache | None) -> pd.DataFrame:
+    return Etl._transform(df, cache=cache, zones=_worker_zones)
+
+
 def _round(df: pd.DataFrame, precision: int = 4) -> pd.DataFrame:
     cols = [
         "pickup_longitude",
@@ -166,32 +328,112 @@ def _read_yaml_bbox(
     return d["ul"], d["lr"]
 
 
-def discard_outlier_rows(df: pd.DataFrame) -> pd.DataFrame:
+class OutlierFilter:
+    """Discards trips where the meter was left running, or that stray far from NYC.
+
+    The bounding box is read just once, and the filter is idempotent:
+    a frame with nothing to discard, such as one it already filtered,
+    is returned as-is, uncopied, after a single cheap pass over its columns.
+    """
+
     FOUR_HOURS = 4 * 60 * 60  # Somewhat commonly we see 86400 second "trips".
-    long_trips = _round(df[df.trip_duration >= FOUR_HOURS])
-    long_trips.to_csv(temp_dir() / "constant/outlier_long_trips.csv", index=False)
-    # Discard trips where cabbie forgot to turn off the meter.
-    df = df[df.trip_duration < FOUR_HOURS]
-
-    ul, lr = _read_yaml_bbox()
-    df = df[
-        True
-        & (lr[0] < df.pickup_latitude)
-        & (df.pickup_latitude < ul[0])
-        & (ul[1] < df.pickup_longitude)
-        & (df.pickup_longitude < lr[1])
-        & (lr[0] < df.dropoff_latitude)
-        & (df.dropoff_latitude < ul[0])
-        & (ul[1] < df.dropoff_longitude)
-        & (df.dropoff_longitude < lr[1])
+    COLUMNS = [
+        "passenger_count",
+        "trip_duration",
+        "pickup_longitude",
+        "pickup_latitude",
+        "dropoff_longitude",
+        "dropoff_latitude",
     ]
 
-    assert df.passenger_count.max() <= 9
-    return df
+    def __init__(self, config_file: Path = CONFIG_FILE) -> None:
+        self.ul, self.lr = map(tuple, _read_yaml_bbox(config_file))
 
+    def __call__(
+        self, df: pd.DataFrame, long_trips_csv: Path | None = None
+    ) -> pd.DataFrame:
+        if long_trips_csv:
+            long_trips = _round(df[df.trip_duration >= self.FOUR_HOURS])
+            long_trips.to_csv(long_trips_csv, index=False)
 
-def main(in_csv: Path) -> None:
-    Etl(in_csv.parent / "taxi.db").create_table(in_csv)
+        keep = self.mask(df)
+        if not keep.all():
+            df = df[keep]
+        assert df.empty or df.passenger_count.max() <= 9  # a chunk may be all outliers
+        return df
+
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        """Returns True for rows worth keeping, computed in a single pass."""
+        n_lat, w_lng = self.ul
+        s_lat, e_lng = self.lr
+        # Discard trips where cabbie forgot to turn off the meter.
+        keep: np.ndarray = df.trip_duration.to_numpy() < self.FOUR_HOURS
+        for col, lo, hi in [
+            ("pickup_latitude", s_lat, n_lat),
+            ("pickup_longitude", w_lng, e_lng),
+            ("dropoff_latitude", s_lat, n_lat),
+            ("dropoff_longitude", w_lng, e_lng),
+        ]:
+            values = df[col].to_numpy()
+            keep &= lo < values
+            keep &= values < hi
+        return keep
+
+    def pushdown(self) -> dict[str, Any]:
+        """Returns load_trips() filters that discard the same rows as mask()."""
+        n_lat, w_lng = self.ul
+        s_lat, e_lng = self.lr
+        return dict(bbox=(w_lng, s_lat, e_lng, n_lat), duration=(None, self.FOUR_HOURS))
+
+
+@cache
+def _outlier_filter() -> OutlierFilter:
+    return OutlierFilter()
+
+
+def discard_outlier_rows(
+    df: pd.DataFrame, long_trips_csv: Path | None = None
+) -> pd.DataFrame:
+    return _outlier_filter()(df, long_trips_csv)
+
+
+@timed
+def load_clean_trips(
+    columns: list[str] | None = None,
+    limit: int | None = None,
+    in_file: Path = COMPRESSED_DATASET,
+    **filters: Any,
+) -> pd.DataFrame:
+    """Loads trips via load_trips(), discarding outliers during the parquet scan.
+
+    When there are no other FILTERS and a fresh snapshot of the dataset exists,
+    it is memory-mapped instead, see write_snapshot().
+    The outlier filter needs a few COLUMNS of its own, which are read as well.
+    """
+    outlier_filter = _outlier_filter()
+    if columns is not None:
+        columns = list(dict.fromkeys(columns + OutlierFilter.COLUMNS))
+    snapshot = snapshot_file(in_file)
+    if not filters and is_fresh(snapshot, in_file):
+        df = read_snapshot(snapshot, columns, limit)
+    else:
+        pushdown = outlier_filter.pushdown() | filters
+        df = load_trips(columns, limit=limit, in_file=in_file, **pushdown)
+    return outlier_filter(df)
+
+
+def main(
+    in_csv: Path,
+    chunksize: int | None = None,
+    workers: int = 1,
+    cache: bool = False,
+    snapshot: bool = False,
+    json_logs: bool = False,
+) -> None:
+    configure_logging(json_lines=json_logs, processes=workers > 1)
+    stage_cache = StageCache() if cache else None
+    etl = Etl(in_csv.parent / "taxi.db", cache=stage_cache, snapshot=snapshot)
+    etl.create_table(in_csv, chunksize, workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
+
+from constant.ch02_taxi.jh.etl import Etl, OutlierFilter, discard_outlier_rows
+from constant.ch02_taxi.jh.synthetic import synthetic_trips, synthetic_zones, taxi_bbox
+from constant.ch02_taxi.jh.zones import TlcZoneIndex
+
+
+class OutlierFilterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.df = pd.DataFrame(
+            {
+                "passenger_count": [1, 2, 1, 1],
+                "trip_duration": [600, 86_400, 900, 1_200],
+                "pickup_latitude": [40.752, 40.752, 37.4, 40.75],
+                "pickup_longitude": [-73.978, -73.978, -121.9, -73.99],
+                "dropoff_latitude": [40.64, 40.77, 40.75, 40.76],
+                "dropoff_longitude": [-73.78, -73.87, -73.99, -73.98],
+            }
+        )
+
+    def test_discard(self) -> None:
+        df = discard_outlier_rows(self.df)
+        self.assertEqual([0, 3], list(df.index))
+
+    def test_discard_everything(self) -> None:
+        df = discard_outlier_rows(self.df.iloc[[1, 2]])  # a chunk of outliers
+        self.assertEqual(0, len(df))
+
+    def test_idempotent(self) -> None:
+        outlier_filter = OutlierFilter()
+        df = outlier_filter(self.df)
+        self.assertIs(df, outlier_filter(df))
+        self.assertIs(df, discard_outlier_rows(df))
+
+        head = df[:1]
+        self.assertIs(head, outlier_filter(head))
+
+        clean = self.df.iloc[[0, 3]].copy()  # nothing to discard, so no copy needed
+        self.assertIs(clean, outlier_filter(clean))
+
+        # A filtered frame that gains outliers again is filtered again.
+        dirty = pd.concat([df, self.df])
+        self.assertEqual([0, 3, 0, 3], list(outlier_filter(dirty).index))
+        edited = df.copy()
+        edited.loc[0, "trip_duration"] = 86_400
+        self.assertEqual([3], list(outlier_filter(edited).index))
+
+    def test_long_trips_csv(self) -> None:
+        with TemporaryDirectory() as temp:
+            long_trips_csv = Path(temp) / "long.csv"
+            discard_outlier_rows(self.df, long_trips_csv)
+            self.assertEqual([86_400], list(pd.read_csv(long_trips_csv).trip_duration))
+
+
+class EtlTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temp = TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.temp = Path(temp.name)
+        self.zones = TlcZoneIndex(synthetic_zones(0.07, taxi_bbox()), cell_size=500)
+
+        df = synthetic_trips(3_000, seed=1, outlier_rate=0.01)
+        df.insert(1, "vendor_id", 2)
+        df["store_and_fwd_flag"] = np.where(df.index % 100 == 0, "Y", "N")
+        self.in_csv = self.temp / "train.csv"
+        df.to_csv(self.in_csv, index=False)
+
+    def load(
+        self, name: str, chunksize: int | None = None, workers: int = 1
+    ) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Returns the trip table and the parquet dataset, as written by a load."""
+        folder = self.temp / name
+        folder.mkdir()
+        etl = Etl(
+            folder / "taxi.db",
+            dataset=folder / "trip.parquet",
+            long_trips_csv=folder / "long.csv",
+            zones=self.zones,
+        )
+        etl.create_table(self.in_csv, chunksize, workers)
+        table = pd.read_sql_table("trip", etl.engine)
+        etl.engine.dispose()
+        return table, pd.read_parquet(folder / "trip.parquet")
+
+    def test_chunks_and_workers(self) -> None:
+        table, dataset = self.load("serial")
+        self.assertGreater(len(table), 2_900)
+        self.assertLess(len(table), 3_000)
+        self.assertEqual(len(table), len(dataset))
+        self.assertGreater(table.pickup_zone.notna().mean(), 0.999)
+
+        def by_id(df: pd.DataFrame) -> pd.DataFrame:
+            # Dictionaries list the zones in the order that chunks first saw them.
+            categorical = df.select_dtypes("category").columns
+            df = df.astype({col: object for col in categorical})
+            return df.sort_values("id", ignore_index=True)
+
+        loads = {}
+        for chunksize, workers in [(None, 2), (700, 1), (700, 2)]:
+            loads[chunksize, workers] = self.load(
+                f"{chunksize}-{workers}", chunksize, workers
+            )
+            chunked_table, chunked_dataset = loads[chunksize, workers]
+            pd.testing.assert_frame_equal(by_id(table), by_id(chunked_table))
+            pd.testing.assert_frame_equal(by_id(dataset), by_id(chunked_dataset))
+
+        # Given the same chunks, workers write exactly what a serial run does.
+        pd.testing.assert_frame_equal(loads[700, 1][0], loads[700, 2][0])
+        pd.testing.assert_frame_equal(loads[700, 1][1], loads[700, 2][1])
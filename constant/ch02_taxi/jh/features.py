@@ -4,23 +4,27 @@
 
 import warnings
 from collections import Counter
-from time import time
-from typing import Generator
+from datetime import datetime
+from functools import cache
+from typing import TYPE_CHECKING, Any
 
-import geopandas as gpd
 import numpy as np
 import pandas as pd
-from cartopy.geodesic import Geodesic
 
+from constant.ch02_taxi.jh.geodesic import vincenty_inverse
 from constant.util.path import temp_dir
 from constant.util.timing import timed
 
+if TYPE_CHECKING:
+    from cartopy.geodesic import Geodesic
+
+    from constant.ch02_taxi.jh.zones import TlcZoneIndex
+
 warnings.filterwarnings("ignore", message="Conversion of an array with ndim > 0")
 
 
 COMPRESSED_DATASET = temp_dir() / "constant/trip.parquet"
-
-wgs84: Geodesic = Geodesic()
+TLC_ZONE_SHAPEFILE = temp_dir() / "constant/taxi_zones.zip"
 
 # This is very near both the median pickup and median dropoff point,
 # Bryant Park behind the lions at the NYPL.
@@ -28,24 +32,27 @@ wgs84: Geodesic = Geodesic()
 grand_central_nyc = 40.752, -73.978
 
 
+@timed
 def add_pickup_dow_hour(df: pd.DataFrame) -> pd.DataFrame:
     """Add day-of-week and hour-of-day features."""
-    df.loc[:, ("dow",)] = df["pickup_datetime"].copy().dt.dayofweek  # Monday=0
-    df.loc[:, ("hour",)] = df["pickup_datetime"].copy().dt.hour
+    # Narrow int8 columns, as in the compact dataset, which may already hold them.
+    # Those are replaced, not written in place, as a snapshot's are read-only.
+    df["dow"] = df.pickup_datetime.dt.dayofweek.astype(np.int8)  # Monday=0
+    df["hour"] = df.pickup_datetime.dt.hour.astype(np.int8)
     return df
 
 
-def _direction(row: pd.Series) -> float:
-    """Return azimuth of a single trip."""
-    begin = (row["pickup_latitude"], row["pickup_longitude"])
-    end = (row["dropoff_latitude"], row["dropoff_longitude"])
-    bearing, _ = azimuth(begin, end)
-    return round(bearing)
-
-
 @timed
-def add_direction(df: pd.DataFrame) -> pd.DataFrame:
-    df["direction"] = df.apply(lambda row: _direction(row), axis=1)
+def add_direction(
+    df: pd.DataFrame, chunk_size: int | None = None, with_distance: bool = False
+) -> pd.DataFrame:
+    """Add integer azimuth, and optionally geodesic distance, in a single pass."""
+    begin = df[["pickup_latitude", "pickup_longitude"]].to_numpy()
+    end = df[["dropoff_latitude", "dropoff_longitude"]].to_numpy()
+    degrees, meters = azimuths(begin, end, chunk_size)
+    df["direction"] = np.trunc(degrees).astype(int)  # same as int() of each azimuth
+    if with_distance:
+        df["distance"] = meters.round(2)
     return df
 
 
@@ -53,67 +60,155 @@ def azimuth(
     begin_lat_lng: tuple[float, float], end_lat_lng: tuple[float, float]
 ) -> tuple[float, float]:
     """Return the azimuth angle when heading from BEGIN to END, and also distance."""
-    begin_lng_lat = np.array(list(reversed(begin_lat_lng)))
-    end_lng_lat = np.array(list(reversed(end_lat_lng)))
-    meters, degrees, _ = map(int, wgs84.inverse(begin_lng_lat, end_lng_lat)[0])
+    degrees, meters = azimuths(np.array([begin_lat_lng]), np.array([end_lat_lng]))
+    return int(degrees[0]), int(meters[0])
+
+
+def azimuths(
+    begin_lat_lng: np.ndarray, end_lat_lng: np.ndarray, chunk_size: int | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return azimuths and distances for (N, 2) arrays of BEGIN and END points.
+
+    A single Geodesic.inverse() call handles the whole array,
+    or each CHUNK_SIZE rows of it, to cap the size of temporaries.
+    """
+    n = len(begin_lat_lng)
+    chunk_size = chunk_size or max(n, 1)
+    degrees = np.empty(n)
+    meters = np.empty(n)
+    for i in range(0, n, chunk_size):
+        chunk = slice(i, i + chunk_size)
+        begin_lng_lat = begin_lat_lng[chunk, ::-1]
+        end_lng_lat = end_lat_lng[chunk, ::-1]
+        result = _wgs84().inverse(begin_lng_lat, end_lng_lat)
+        meters[chunk] = result[:, 0]
+        degrees[chunk] = result[:, 1]
     return degrees, meters
 
 
-# wgs84:
-_tlc_zone_shapes = gpd.read_file(temp_dir() / "constant/taxi_zones.zip").to_crs(
-    "EPSG:2263"
-)
+@cache
+def _wgs84() -> "Geodesic":
+    from cartopy.geodesic import Geodesic  # deferred, as it is slow to import
 
+    return Geodesic()
 
-@timed
-def add_tlc_zone(df: pd.DataFrame) -> pd.DataFrame:
-    wgs_84 = "EPSG:4326"
-    df["pickup_pt"] = gpd.points_from_xy(df.pickup_longitude, df.pickup_latitude)
-    gdf = gpd.GeoDataFrame(df, geometry="pickup_pt", crs=wgs_84).to_crs(epsg=2263)
-    assert "EPSG:2263" == gdf.crs, gdf.crs  # https://epsg.io/2263 NAD83 / New York L.I.
-    assert "EPSG:2263" == _tlc_zone_shapes.crs, _tlc_zone_shapes.crs
-    assert gdf.crs.is_projected
-    assert _tlc_zone_shapes.crs.is_projected
-
-    t0 = time()
-    joined_pu = gdf.sjoin_nearest(
-        _tlc_zone_shapes, how="left", distance_col="join_distance"
-    )
-    elapsed = time() - t0
-    elapsed > 1 and print(f"joined_pu: {elapsed:.3f} seconds")
-    assert joined_pu.join_distance.quantile(0.9992) == 0
-    joined_pu = joined_pu[joined_pu.join_distance == 0]
-    df["pickup_borough"] = joined_pu.borough
-    df["pickup_zone"] = joined_pu.zone
-
-    # and now attend to the destination:
-    df["dropoff_pt"] = gpd.points_from_xy(df.dropoff_longitude, df.dropoff_latitude)
-    gdf = gpd.GeoDataFrame(df, geometry="dropoff_pt", crs=wgs_84).to_crs(epsg=2263)
-    joined_dr = gdf.sjoin_nearest(
-        _tlc_zone_shapes, how="left", distance_col="join_distance"
-    )
-    if len(df) > 1:  # Ignore the Logan test.
-        assert joined_dr.join_distance.quantile(0.997) == 0
 
-    joined_dr = joined_dr[joined_dr.join_distance == 0]
-    df["dropoff_borough"] = joined_dr.borough
-    df["dropoff_zone"] = joined_dr.zone
+@timed
+def add_tlc_zone(df: pd.DataFrame, zones: "TlcZoneIndex | None" = None) -> pd.DataFrame:
+    """Add borough and zone of both pickup and dropoff, in one batched lookup.
+
+    ZONES defaults to the TLC's own, from tlc_zone_index().
+    """
+    from constant.ch02_taxi.jh.zones import tlc_zone_index  # deferred, like _wgs84()
+
+    lng = np.concatenate([df.pickup_longitude, df.dropoff_longitude])
+    lat = np.concatenate([df.pickup_latitude, df.dropoff_latitude])
+    borough, zone = (zones or tlc_zone_index()).lookup(lng, lat)
+    n = len(df)
+
+    if n:  # A chunk may have lost every row to the outlier filter.
+        assert np.mean(zone[:n] != None) >= 0.9992  # noqa E711
+    df["pickup_borough"] = borough[:n]
+    df["pickup_zone"] = zone[:n]
+
+    if n > 1:  # Ignore the Logan test.
+        assert np.mean(zone[n:] != None) >= 0.997  # noqa E711
+    df["dropoff_borough"] = borough[n:]
+    df["dropoff_zone"] = zone[n:]
     return df
 
 
-def _get_borough_pairs(df: pd.DataFrame) -> Generator[tuple[str, str], None, None]:
-    for _, row in df.iterrows():
-        yield (row.pickup_borough, row.dropoff_borough)
-
-
-def get_borough_matrix(df: pd.DataFrame) -> Counter:
-    return Counter(sorted(_get_borough_pairs(df)))
-
-
-def _get_zone_pairs(df: pd.DataFrame) -> Generator[tuple[str, str], None, None]:
-    for _, row in df.iterrows():
-        yield (row.pickup_zone, row.dropoff_zone)
-
-
-def get_zone_matrix(df: pd.DataFrame) -> Counter:
-    return Counter(sorted(_get_zone_pairs(df)))
+def featurize(
+    pickup_dt: datetime,
+    plat: float,
+    plng: float,
+    dlat: float,
+    dlng: float,
+    passenger_count: int = 1,
+    zones: "TlcZoneIndex | None" = None,
+) -> dict[str, Any]:
+    """Returns the features of a single trip, matching the batch path's values.
+
+    That is, add_pickup_dow_hour(), add_direction(), and the ETL's distance,
+    plus add_tlc_zone() if given ZONES, e.g. tlc_zone_index().  No DataFrame
+    is built, so a trip takes microseconds, as real-time dispatch requires.
+    """
+    meters, degrees = vincenty_inverse(plat, plng, dlat, dlng)
+    features: dict[str, Any] = dict(
+        pickup_latitude=plat,
+        pickup_longitude=plng,
+        dropoff_latitude=dlat,
+        dropoff_longitude=dlng,
+        passenger_count=passenger_count,
+        distance=round(meters, 2),
+        direction=int(degrees),  # truncates, as in add_direction()
+        dow=pickup_dt.weekday(),  # Monday=0
+        hour=pickup_dt.hour,
+    )
+    if zones is not None:
+        for end, lng, lat in [("pickup", plng, plat), ("dropoff", dlng, dlat)]:
+            borough, zone = zones.lookup_point(lng, lat)
+            features[f"{end}_borough"] = borough
+            features[f"{end}_zone"] = zone
+    return features
+
+
+def od_matrix(
+    df: pd.DataFrame,
+    level: str = "borough",
+    hour: int | None = None,
+    dow: int | None = None,
+    sparse: bool = False,
+) -> pd.DataFrame:
+    """Returns origin-destination trip counts, pickup rows by dropoff columns.
+
+    LEVEL is "borough" or "zone".  Optionally only trips of a given HOUR or
+    day-of-week DOW are counted.  The SPARSE matrix suits zone pairs, most of
+    which see no trips.  Trips with an unknown origin or destination are ignored.
+    """
+    pu_codes, pu_names = pd.factorize(df[f"pickup_{level}"])
+    do_codes, do_names = pd.factorize(df[f"dropoff_{level}"])
+    labels = np.array(sorted(set(pu_names) | set(do_names)), dtype=object)
+    n = len(labels)
+    # Recode both sides against the sorted union of names, retaining -1 for NA.
+    pu = np.append(np.searchsorted(labels, pu_names), -1)[pu_codes]
+    do = np.append(np.searchsorted(labels, do_names), -1)[do_codes]
+
+    keep = (pu >= 0) & (do >= 0)
+    if hour is not None:
+        keep &= df.hour.to_numpy() == hour
+    if dow is not None:
+        keep &= df.dow.to_numpy() == dow
+    pu, do = pu[keep], do[keep]
+
+    index = pd.Index(labels, name=f"pickup_{level}")
+    columns = pd.Index(labels, name=f"dropoff_{level}")
+    if sparse:
+        from scipy.sparse import coo_matrix
+
+        # Never allocates the n × n dense matrix; duplicate pairs are summed.
+        ones = np.ones(len(pu), dtype=np.int64)
+        matrix = coo_matrix((ones, (pu, do)), shape=(n, n)).tocsr()
+        return pd.DataFrame.sparse.from_spmatrix(matrix, index, columns)
+    counts = np.bincount(pu * n + do, minlength=n * n).reshape(n, n)
+    return pd.DataFrame(counts, index, columns)
+
+
+def od_counter(matrix: pd.DataFrame) -> Counter:
+    """Returns a Counter of (pickup, dropoff) pairs, in sorted order, omitting zeros."""
+    counts = matrix.to_numpy()
+    rows, cols = np.nonzero(counts)
+    pairs = zip(matrix.index[rows], matrix.columns[cols])
+    return Counter(dict(zip(pairs, counts[rows, cols].tolist())))
+
+
+def get_borough_matrix(
+    df: pd.DataFrame, hour: int | None = None, dow: int | None = None
+) -> Counter:
+    return od_counter(od_matrix(df, "borough", hour, dow))
+
+
+def get_zone_matrix(
+    df: pd.DataFrame, hour: int | None = None, dow: int | None = None
+) -> Counter:
+    return od_counter(od_matrix(df, "zone", hour, dow))
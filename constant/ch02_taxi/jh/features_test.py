@@ -5,6 +5,7 @@ import unittest
 from operator import itemgetter
 
 import duckdb
+import numpy as np
 import pandas as pd
 
 from constant.ch02_taxi.jh.features import (
@@ -13,10 +14,15 @@ from constant.ch02_taxi.jh.features import (
     add_pickup_dow_hour,
     add_tlc_zone,
     azimuth,
+    azimuths,
+    featurize,
     get_borough_matrix,
     get_zone_matrix,
     grand_central_nyc,
+    od_matrix,
 )
+from constant.ch02_taxi.jh.synthetic import synthetic_zones
+from constant.ch02_taxi.jh.zones import TlcZoneIndex
 from constant.util.path import constant
 
 
@@ -39,18 +45,87 @@ class FeaturesTest(unittest.TestCase):
         angle, distance = map(int, azimuth(grand_central_nyc, self.logan_boston))
         self.assertEqual((53, 305_719), (angle, distance))
 
+    def test_azimuths(self) -> None:
+        begin = np.array([grand_central_nyc, self.logan_boston, grand_central_nyc])
+        end = np.array([self.logan_boston, grand_central_nyc, grand_central_nyc])
+        degrees, meters = azimuths(begin, end, chunk_size=2)
+        self.assertEqual([53, -124, 180], list(map(int, degrees)))
+        self.assertEqual([305_719, 305_719, 0], list(map(int, meters)))
+
+        df = add_direction(self.df, with_distance=True)
+        self.assertEqual(53, df.direction[0])
+        self.assertEqual(305_719.37, df.distance[0])
+
     def test_add_pickup_dow_hour(self) -> None:
         df = add_pickup_dow_hour(self.df)
         df = add_direction(df)
         self.assertEqual(1, df.dow[0])
         self.assertEqual(12, df.hour[0])
 
+    def test_featurize(self) -> None:
+        rng = np.random.default_rng(seed=42)
+        n = 1_000
+        df = pd.DataFrame(
+            {
+                "pickup_datetime": pd.Timestamp("2016-01-01")
+                + pd.to_timedelta(rng.integers(0, 182 * 86_400, n), unit="s"),
+                "pickup_latitude": rng.uniform(40.6, 40.85, n),
+                "pickup_longitude": rng.uniform(-74.05, -73.75, n),
+                "dropoff_latitude": rng.uniform(40.6, 40.85, n),
+                "dropoff_longitude": rng.uniform(-74.05, -73.75, n),
+                "passenger_count": rng.integers(1, 7, n),
+            }
+        )
+        zones = TlcZoneIndex(synthetic_zones(), cell_size=500)
+        expected = add_direction(add_pickup_dow_hour(df.copy()), with_distance=True)
+        expected = add_tlc_zone(expected, zones)
+
+        rows = [featurize(*row, zones=zones) for row in df.itertuples(index=False)]
+        actual = pd.DataFrame(rows)
+        self.assertEqual(13, len(actual.columns))
+        for col in actual.columns:  # every feature that featurize() returns
+            self.assertEqual(list(expected[col]), list(actual[col]), col)
+        self.assertEqual(5, expected.pickup_borough.nunique())
+
+    def test_empty_chunk(self) -> None:
+        df = add_pickup_dow_hour(self.df[:0])
+        df = add_direction(df, with_distance=True)
+        df = add_tlc_zone(df, TlcZoneIndex(synthetic_zones()))
+        self.assertEqual(0, len(df))
+        self.assertIn("dropoff_zone", df.columns)
+
+    def test_od_matrix(self) -> None:
+        df = pd.DataFrame(
+            {
+                "pickup_borough": ["Manhattan", "Manhattan", "Queens", None],
+                "dropoff_borough": ["Queens", "Queens", "Manhattan", "Queens"],
+                "hour": [8, 9, 9, 9],
+            }
+        )
+        m = od_matrix(df)
+        self.assertEqual(["Manhattan", "Queens"], list(m.index))
+        self.assertEqual([[0, 2], [1, 0]], m.values.tolist())
+        self.assertEqual([[0, 1], [1, 0]], od_matrix(df, hour=9).values.tolist())
+        s = od_matrix(df, sparse=True)
+        self.assertEqual(0.5, s.sparse.density)
+        self.assertEqual([[0, 2], [1, 0]], s.sparse.to_dense().values.tolist())
+
+        c = get_borough_matrix(df)
+        self.assertEqual(
+            [(("Manhattan", "Queens"), 2), (("Queens", "Manhattan"), 1)],
+            list(c.items()),
+        )
+
     def test_constant(self) -> None:
         self.assertEqual("constant", constant().name)
 
     def test_read_prefix_rows_with_duckdb(self, n_rows=10) -> None:
         """Demonstrates how to rapidly read first few rows from parquet, ignoring the rest."""
-        select = f'SELECT * FROM "{COMPRESSED_DATASET}" OFFSET {n_rows} LIMIT {n_rows}'
+        files = f"{COMPRESSED_DATASET}/**/*.parquet"
+        select = (
+            f"SELECT * FROM read_parquet('{files}', hive_partitioning = true)"
+            f"  OFFSET {n_rows} LIMIT {n_rows}"
+        )
         df = duckdb.query(select).df()
         self.assertEqual(n_rows, len(df))
 
@@ -0,0 +1,76 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+
+import numpy as np
+from geopy.distance import distance
+
+from constant.ch02_taxi.jh.geodesic import (
+    HAVERSINE_MAX_RELATIVE_ERROR,
+    geodesic_distance,
+    haversine_distance,
+    vincenty_inverse,
+)
+
+
+class GeodesicTest(unittest.TestCase):
+    grand_central_nyc = 40.752, -73.978
+    logan_boston = 42.363, -71.006
+
+    def setUp(self) -> None:
+        rng = np.random.default_rng(seed=42)
+        n = 1_000
+        self.lat1 = rng.uniform(40.434, 41.319, n)  # taxi.yml bbox
+        self.lat2 = rng.uniform(40.434, 41.319, n)
+        self.lng1 = rng.uniform(-74.562, -72.711, n)
+        self.lng2 = rng.uniform(-74.562, -72.711, n)
+
+    def test_matches_geopy(self) -> None:
+        expected = [
+            distance(begin, end).m
+            for begin, end in zip(
+                zip(self.lat1, self.lng1),
+                zip(self.lat2, self.lng2),
+            )
+        ]
+        meters = geodesic_distance(self.lat1, self.lng1, self.lat2, self.lng2)
+        self.assertLess(np.abs(meters - expected).max(), 0.01)
+
+    def test_scalar_and_special_cases(self) -> None:
+        meters = geodesic_distance(*self.grand_central_nyc, *self.logan_boston)
+        self.assertAlmostEqual(305_719.37, round(float(meters), 2))
+
+        self.assertEqual(
+            0, geodesic_distance(*self.grand_central_nyc, *self.grand_central_nyc)
+        )
+
+        # Nearly antipodal, where Vincenty does not converge.
+        self.assertAlmostEqual(
+            distance((0, 0), (0.5, 179.7)).m,
+            float(geodesic_distance(0, 0, 0.5, 179.7)),
+            places=6,
+        )
+
+        meters = geodesic_distance([1, np.nan], [2, 3], [3, 4], [5, 6])
+        self.assertTrue(np.isnan(meters[1]))
+
+    def test_vincenty_inverse(self) -> None:
+        meters = geodesic_distance(self.lat1, self.lng1, self.lat2, self.lng2)
+        points = zip(self.lat1, self.lng1, self.lat2, self.lng2)
+        scalar = [vincenty_inverse(*p)[0] for p in points]
+        self.assertLess(np.abs(meters - scalar).max(), 1e-6)
+
+        begin, end = self.grand_central_nyc, self.logan_boston
+        meters, degrees = vincenty_inverse(*begin, *end)
+        self.assertEqual((305_719.37, 53.204), (round(meters, 2), round(degrees, 3)))
+        self.assertEqual((0, 180), vincenty_inverse(*begin, *begin))
+        meters, _ = vincenty_inverse(0, 0, 0.5, 179.7)  # Karney's fallback
+        self.assertAlmostEqual(distance((0, 0), (0.5, 179.7)).m, meters, places=6)
+
+    def test_haversine_error_bound(self) -> None:
+        exact = geodesic_distance(self.lat1, self.lng1, self.lat2, self.lng2)
+        approx = haversine_distance(self.lat1, self.lng1, self.lat2, self.lng2)
+        relative_error = np.abs(approx - exact) / exact
+        self.assertLess(relative_error.max(), 0.003)
+        self.assertLess(relative_error.max(), HAVERSINE_MAX_RELATIVE_ERROR)
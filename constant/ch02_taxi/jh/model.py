@@ -9,15 +9,16 @@ from matplotlib import pyplot as plt
 from sklearn.linear_model import LinearRegression
 from xgboost import XGBRegressor
 
-from constant.ch02_taxi.jh.etl import discard_outlier_rows
+from constant.ch02_taxi.jh.etl import load_clean_trips
 from constant.ch02_taxi.jh.features import COMPRESSED_DATASET, add_pickup_dow_hour
 from constant.util.path import temp_dir
 
 
 def _get_df() -> pd.DataFrame:
     in_file: Path = COMPRESSED_DATASET
-    df = pd.read_parquet(in_file)
-    df = discard_outlier_rows(df)
+    columns = ["pickup_datetime", "distance", "trip_duration"]
+    df = load_clean_trips(columns, in_file=in_file)
+    df["elapsed"] = df.trip_duration
     df = add_pickup_dow_hour(df)
     return df
 
@@ -0,0 +1,203 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Saved duration models, batch prediction, and a small HTTP prediction server."""
+
+import json
+from collections import deque
+from datetime import datetime
+from functools import cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import typer
+import xgboost as xgb
+
+from constant.ch02_taxi.jh.features import azimuths, featurize
+from constant.ch02_taxi.jh.geodesic import geodesic_distance
+from constant.util.logger import configure_logging
+from constant.util.path import temp_dir
+
+MODEL_DIR = temp_dir() / "constant/duration_model"
+MODEL_FILE = "model.ubj"
+MANIFEST_FILE = "manifest.json"
+
+log = getLogger(__name__)
+
+
+def save_model(
+    booster: xgb.Booster,
+    features: list[str],
+    out_dir: Path = MODEL_DIR,
+    **metadata: Any,
+) -> Path:
+    """Saves the booster as UBJSON, beside a manifest of the features it expects."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    booster.save_model(out_dir / MODEL_FILE)
+    manifest = dict(
+        features=features,
+        label="log1p(trip_duration)",
+        best_iteration=int(
+            booster.attr("best_iteration") or booster.num_boosted_rounds() - 1
+        ),
+        xgboost_version=xgb.__version__,
+        **metadata,
+    )
+    (out_dir / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2, default=str))
+    return out_dir
+
+
+class DurationModel:
+    """A saved model, ready to predict trip durations, in seconds."""
+
+    def __init__(self, model_dir: Path = MODEL_DIR) -> None:
+        self.manifest = json.loads((model_dir / MANIFEST_FILE).read_text())
+        self.features: list[str] = self.manifest["features"]
+        self.booster = xgb.Booster(model_file=str(model_dir / MODEL_FILE))
+        self.iteration_range = (0, self.manifest["best_iteration"] + 1)
+
+    def predict(self, trips: pd.DataFrame, batch_size: int = 4096) -> np.ndarray:
+        """Scores TRIPS in micro-batches, which bounds the size of temporaries."""
+        x = trip_features(trips)[self.features].to_numpy(dtype=np.float32)
+        log_durations = np.empty(len(x))
+        for i in range(0, len(x), batch_size):
+            log_durations[i : i + batch_size] = self.booster.inplace_predict(
+                x[i : i + batch_size], iteration_range=self.iteration_range
+            )
+        return np.expm1(log_durations)
+
+    def predict_trip(
+        self,
+        pickup_dt: datetime,
+        plat: float,
+        plng: float,
+        dlat: float,
+        dlng: float,
+        passenger_count: int = 1,
+    ) -> float:
+        """Scores a single trip, in under a millisecond, for dispatch ETAs."""
+        features = featurize(pickup_dt, plat, plng, dlat, dlng, passenger_count)
+        x = np.array([[features[name] for name in self.features]], np.float32)
+        log_duration = self.booster.inplace_predict(
+            x, iteration_range=self.iteration_range
+        )
+        return float(np.expm1(log_duration[0]))
+
+
+@cache
+def load_model(model_dir: Path = MODEL_DIR) -> DurationModel:
+    return DurationModel(model_dir)
+
+
+def predict_durations(trips: pd.DataFrame, model_dir: Path = MODEL_DIR) -> np.ndarray:
+    """Returns predicted trip_duration seconds for requested TRIPS.
+
+    Each trip needs a pickup_datetime and pickup / dropoff coordinates,
+    and optionally a passenger_count.  The model is loaded just once.
+    """
+    return load_model(model_dir).predict(trips)
+
+
+def trip_features(trips: pd.DataFrame) -> pd.DataFrame:
+    """Derives model features from trip requests, with the ETL's vectorized code.
+
+    Columns are computed as numpy arrays, avoiding per-column pandas overhead,
+    which would otherwise dominate the latency of small requests.
+    """
+    pickup = pd.DatetimeIndex(pd.to_datetime(trips["pickup_datetime"]))
+    passengers = trips.get("passenger_count", pd.Series(1, trips.index)).fillna(1)
+    cols = {
+        col: trips[col].to_numpy(dtype=float)
+        for col in [
+            "pickup_longitude",
+            "pickup_latitude",
+            "dropoff_longitude",
+            "dropoff_latitude",
+        ]
+    }
+    begin = np.column_stack([cols["pickup_latitude"], cols["pickup_longitude"]])
+    end = np.column_stack([cols["dropoff_latitude"], cols["dropoff_longitude"]])
+    degrees, _ = azimuths(begin, end)
+    cols |= {
+        "distance": geodesic_distance(*begin.T, *end.T).round(2),
+        "direction": np.trunc(degrees),  # as in add_direction()
+        "passenger_count": passengers.to_numpy(dtype=float),
+        "dow": pickup.dayofweek.to_numpy(),  # as in add_pickup_dow_hour()
+        "hour": pickup.hour.to_numpy(),
+    }
+    return pd.DataFrame(cols, index=trips.index)
+
+
+class PredictionServer(ThreadingHTTPServer):
+    """Serves one model, and keeps the latency of its own recent requests."""
+
+    def __init__(self, address: tuple[str, int], model_dir: Path) -> None:
+        super().__init__(address, PredictionHandler)
+        self.model_dir = model_dir
+        self.latencies: deque[float] = deque(maxlen=10_000)  # seconds
+        self.lock = Lock()
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """POST /predict a JSON list of trips, and GET /stats of request latency."""
+
+    server: PredictionServer
+
+    def do_POST(self) -> None:
+        if self.path != "/predict":
+            self.send_error(404)
+            return
+        t0 = perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            trips = pd.DataFrame(json.loads(self.rfile.read(length)))
+            durations = predict_durations(trips, self.server.model_dir)
+        except (ValueError, KeyError, TypeError) as e:
+            # The reason goes in the body, as the status line must be latin-1.
+            self.send_error(400, explain=f"{type(e).__name__}: {e}")
+            return
+        with self.server.lock:
+            self.server.latencies.append(perf_counter() - t0)
+        self._reply({"trip_duration": durations.round(1).tolist()})
+
+    def do_GET(self) -> None:
+        if self.path != "/stats":
+            self.send_error(404)
+            return
+        with self.server.lock:
+            ms = 1000 * np.array(self.server.latencies)
+        p50, p99 = np.percentile(ms, [50, 99]) if len(ms) else (None, None)
+        self._reply({"requests": len(ms), "p50_ms": p50, "p99_ms": p99})
+
+    def _reply(self, body: dict[str, Any]) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log.debug(format % args)
+
+
+def serve(port: int = 8080, model_dir: Path = MODEL_DIR) -> PredictionServer:
+    """Returns a server for the model, which the caller can serve_forever()."""
+    load_model(model_dir)  # before the first request arrives
+    return PredictionServer(("localhost", port), model_dir)
+
+
+def main(port: int = 8080, model_dir: Path = MODEL_DIR) -> None:
+    server = serve(port, model_dir)
+    log.info(f"  serving {model_dir} at http://localhost:{port}/predict")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    typer.run(main)
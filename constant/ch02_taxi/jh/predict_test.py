@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import json
+import unittest
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from typing import Any
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from constant.ch02_taxi.jh.predict import (
+    load_model,
+    predict_durations,
+    save_model,
+    serve,
+    trip_features,
+)
+from constant.ch02_taxi.jh.train import FEATURES
+
+
+class PredictTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp = TemporaryDirectory()
+        self.model_dir = Path(self.temp.name) / "model"
+        # A model that knows just one thing: trips take a second per 8 meters.
+        rng = np.random.default_rng(0)
+        x = rng.uniform(0, 1, (2_000, len(FEATURES)))
+        x[:, FEATURES.index("distance")] = rng.uniform(500, 20_000, len(x))
+        y = np.log1p(x[:, FEATURES.index("distance")] / 8)
+        dtrain = xgb.DMatrix(x, y, feature_names=FEATURES)
+        booster = xgb.train(dict(max_depth=4, nthread=1), dtrain, 100)
+        save_model(booster, FEATURES, self.model_dir, trained_on="synthetic")
+
+        self.trips: list[dict[str, Any]] = [
+            dict(
+                pickup_datetime="2016-03-14 17:24:55",
+                pickup_longitude=-73.982,
+                pickup_latitude=40.768,
+                dropoff_longitude=-73.965,
+                dropoff_latitude=40.766,
+            ),
+            dict(
+                pickup_datetime="2016-06-12 00:43:35",
+                passenger_count=2,
+                pickup_longitude=-73.980,
+                pickup_latitude=40.739,
+                dropoff_longitude=-73.999,
+                dropoff_latitude=40.731,
+            ),
+        ]
+
+    def tearDown(self) -> None:
+        load_model.cache_clear()
+        self.temp.cleanup()
+
+    def test_trip_features(self) -> None:
+        df = trip_features(pd.DataFrame(self.trips))
+        self.assertEqual([0, 6], list(df.dow))
+        self.assertEqual([17, 0], list(df.hour))
+        self.assertEqual([1, 2], list(df.passenger_count))
+        self.assertEqual([1_452.4, 1_834.42], list(df.distance))
+
+    def test_predict_durations(self) -> None:
+        durations = predict_durations(pd.DataFrame(self.trips), self.model_dir)
+        distance = trip_features(pd.DataFrame(self.trips)).distance
+        np.testing.assert_allclose(distance / 8, durations, rtol=0.1)
+        self.assertEqual("synthetic", load_model(self.model_dir).manifest["trained_on"])
+
+    def test_predict_trip(self) -> None:
+        trip = self.trips[1]
+        duration = load_model(self.model_dir).predict_trip(
+            datetime.fromisoformat(trip["pickup_datetime"]),
+            trip["pickup_latitude"],
+            trip["pickup_longitude"],
+            trip["dropoff_latitude"],
+            trip["dropoff_longitude"],
+            trip["passenger_count"],
+        )
+        expected = predict_durations(pd.DataFrame(self.trips), self.model_dir)[1]
+        self.assertAlmostEqual(expected, duration, places=3)
+
+    def test_server(self) -> None:
+        server = serve(0, self.model_dir)
+        Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://localhost:{server.server_address[1]}"
+        try:
+            for _ in range(3):
+                with urlopen(f"{url}/predict", json.dumps(self.trips).encode()) as r:
+                    self.assertEqual(2, len(json.load(r)["trip_duration"]))
+            with urlopen(f"{url}/stats") as r:
+                stats = json.load(r)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(3, stats["requests"])
+        self.assertLess(stats["p50_ms"], stats["p99_ms"] + 1e-9)
+
+    def test_bad_requests(self) -> None:
+        server = serve(0, self.model_dir)
+        Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://localhost:{server.server_address[1]}"
+        no_dropoff = [
+            {k: v for k, v in t.items() if "dropoff" not in k} for t in self.trips
+        ]
+        try:
+            for body in [b"[{", b'"a trip"', json.dumps(no_dropoff).encode()]:
+                with self.assertRaises(HTTPError) as cm:
+                    urlopen(f"{url}/predict", body)
+                self.assertEqual(400, cm.exception.code)
+                cm.exception.close()
+            with urlopen(f"{url}/stats") as r:
+                self.assertEqual(0, json.load(r)["requests"])  # not another's window
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,70 @@
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Indexed queries against the trip table of taxi.db."""
+
+from datetime import datetime
+from functools import cache
+from pathlib import Path
+
+import pandas as pd
+import sqlalchemy as sa
+
+from constant.ch02_taxi.jh.bulk_load import SQLITE_DATETIME_FORMAT
+from constant.util.path import temp_dir
+
+TAXI_DB = temp_dir() / "constant/taxi.db"
+
+_DATE_COLS = ["pickup_datetime", "dropoff_datetime"]
+
+
+@cache
+def get_engine(db_file: Path = TAXI_DB) -> sa.Engine:
+    """Returns an engine whose pool of connections is shared by all queries."""
+    return sa.create_engine(
+        f"sqlite:///{db_file}", poolclass=sa.QueuePool, pool_size=4, echo=False
+    )
+
+
+def _query(sql: str, db_file: Path, **params: object) -> pd.DataFrame:
+    with get_engine(db_file).connect() as conn:
+        df = pd.read_sql_query(sa.text(sql), conn, params=params)
+    for col in _DATE_COLS:
+        if col in df:
+            df[col] = pd.to_datetime(df[col])
+    return df
+
+
+def trips_between(t0: datetime, t1: datetime, db_file: Path = TAXI_DB) -> pd.DataFrame:
+    """Returns trips with pickup in the half-open interval [T0, T1)."""
+    sql = """
+        SELECT  *
+        FROM    trip
+        WHERE   pickup_datetime >= :t0  AND  pickup_datetime < :t1
+        ORDER BY pickup_datetime
+    """
+    # Stored as text, so compare against identically formatted text.
+    t0_, t1_ = (t.strftime(SQLITE_DATETIME_FORMAT) for t in (t0, t1))
+    return _query(sql, db_file, t0=t0_, t1=t1_)
+
+
+def trips_for_zone_pair(
+    pickup_zone: str, dropoff_zone: str, db_file: Path = TAXI_DB
+) -> pd.DataFrame:
+    """Returns trips from one TLC zone to another, e.g. "Midtown Center" to "JFK Airport"."""
+    sql = """
+        SELECT  *
+        FROM    trip
+        WHERE   pickup_zone = :pickup_zone  AND  dropoff_zone = :dropoff_zone
+        ORDER BY pickup_datetime
+    """
+    return _query(sql, db_file, pickup_zone=pickup_zone, dropoff_zone=dropoff_zone)
+
+
+def hourly_counts(db_file: Path = TAXI_DB) -> pd.DataFrame:
+    """Returns trip count by day-of-week and hour, answered from the index alone."""
+    sql = """
+        SELECT    dow, hour, COUNT(*) AS trips
+        FROM      trip
+        GROUP BY  dow, hour
+        ORDER BY  dow, hour
+    """
+    return _query(sql, db_file)
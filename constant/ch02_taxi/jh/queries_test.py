@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+import sqlalchemy as sa
+
+from constant.ch02_taxi.jh.bulk_load import BulkLoader
+from constant.ch02_taxi.jh.etl import Etl
+from constant.ch02_taxi.jh.queries import (
+    get_engine,
+    hourly_counts,
+    trips_between,
+    trips_for_zone_pair,
+)
+
+
+class QueriesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp = TemporaryDirectory()
+        self.db_file = Path(self.temp.name) / "taxi.db"
+        pickup = pd.date_range("2016-01-04", periods=48, freq="h")  # a Monday
+        df = pd.DataFrame(
+            {
+                "id": [f"id{i}" for i in range(len(pickup))],
+                "pickup_datetime": pickup,
+                "dow": pickup.dayofweek,
+                "hour": pickup.hour,
+                "pickup_zone": ["Midtown Center", "Midtown East"] * 24,
+                "dropoff_zone": ["JFK Airport"] * 48,
+            }
+        )
+        engine = get_engine(self.db_file)
+        with engine.begin() as sess:
+            sess.execute(Etl.ddl)
+        with BulkLoader(engine, "trip", Etl.post_load_sql) as loader:
+            loader.insert(df)
+
+    def tearDown(self) -> None:
+        get_engine(self.db_file).dispose()
+        self.temp.cleanup()
+
+    def test_queries(self) -> None:
+        df = trips_between(
+            datetime(2016, 1, 4, 22), datetime(2016, 1, 5, 2), self.db_file
+        )
+        self.assertEqual([22, 23, 0, 1], list(df.hour))
+        self.assertTrue(pd.api.types.is_datetime64_dtype(df.pickup_datetime))
+
+        df = trips_for_zone_pair("Midtown East", "JFK Airport", self.db_file)
+        self.assertEqual(24, len(df))
+
+        df = hourly_counts(self.db_file)
+        self.assertEqual(48, len(df))
+        self.assertEqual({1}, set(df.trips))
+
+    def test_indexes_are_used(self) -> None:
+        plans = {
+            "trip_pickup_datetime": "WHERE pickup_datetime >= ''",
+            "trip_zone_pair": "WHERE pickup_zone = '' AND dropoff_zone = ''",
+            "COVERING INDEX trip_dow_hour": "GROUP BY dow, hour",
+        }
+        with get_engine(self.db_file).connect() as conn:
+            for index, sql in plans.items():
+                sql = f"EXPLAIN QUERY PLAN  SELECT dow, hour FROM trip {sql}"
+                plan = conn.execute(sa.text(sql)).fetchall()
+                self.assertIn(index, str(plan))
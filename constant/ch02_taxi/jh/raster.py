@@ -0,0 +1,91 @@
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Density rasters of trip locations, in place of alpha-blended scatter plots.
+
+Binning millions of points into a grid of counts takes a single bincount(),
+and the grid renders as one image, however many trips it summarizes.
+"""
+
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.image import AxesImage
+
+from constant.ch02_taxi.jh.dataset import BBox
+
+Shape = tuple[int, int]  # rows (south to north), columns (west to east)
+
+TIGHT_BBOX = (-74.05, 40.7, -73.8, 40.85)  # Manhattan and its near neighbors
+
+
+def data_bbox(lng: np.ndarray, lat: np.ndarray, trim: float = 0.001) -> BBox:
+    """Returns a box around the points, ignoring a TRIM fraction of strays."""
+    west, east = np.nanquantile(lng, [trim, 1 - trim])
+    south, north = np.nanquantile(lat, [trim, 1 - trim])
+    return float(west), float(south), float(east), float(north)
+
+
+def density(
+    lng: np.ndarray, lat: np.ndarray, bbox: BBox, shape: Shape = (600, 600)
+) -> np.ndarray:
+    """Returns the number of points in each cell of a grid spanning BBOX."""
+    cells = _cells(lng, lat, bbox, shape)
+    counts = np.bincount(cells[cells >= 0], minlength=shape[0] * shape[1])
+    return counts.reshape(shape)
+
+
+def hour_dow_density(
+    hour: np.ndarray,
+    dow: np.ndarray,
+    lng: np.ndarray,
+    lat: np.ndarray,
+    bbox: BBox,
+    shape: Shape = (256, 320),
+) -> np.ndarray:
+    """Returns a density() grid for each hour and day-of-week, computed in one pass.
+
+    The result is indexed [hour, dow, row, column].
+    """
+    cells = _cells(lng, lat, bbox, shape)
+    keep = cells >= 0
+    n = shape[0] * shape[1]
+    hour_dow = np.asarray(hour, dtype=np.int64) * 7 + np.asarray(dow, dtype=np.int64)
+    counts = np.bincount(hour_dow[keep] * n + cells[keep], minlength=24 * 7 * n)
+    return counts.reshape(24, 7, *shape)
+
+
+def _cells(lng: np.ndarray, lat: np.ndarray, bbox: BBox, shape: Shape) -> np.ndarray:
+    """Returns the flat grid cell index of each point, or -1 if outside BBOX."""
+    west, south, east, north = bbox
+    rows, cols = shape
+    x = (np.asarray(lng, dtype=float) - west) * (cols / (east - west))
+    y = (np.asarray(lat, dtype=float) - south) * (rows / (north - south))
+    inside = (0 <= x) & (x < cols) & (0 <= y) & (y < rows)  # False for NaN
+    x = np.where(inside, x, 0).astype(np.int64)
+    y = np.where(inside, y, 0).astype(np.int64)
+    return np.where(inside, y * cols + x, -1)
+
+
+def to_image(grid: np.ndarray, log: bool = True) -> np.ndarray:
+    """Scales counts to [0, 1], logarithmically so sparse streets remain visible."""
+    values = np.log1p(grid) if log else grid.astype(float)
+    peak = values.max(initial=0)
+    return values / peak if peak > 0 else values
+
+
+def show_density(
+    ax: Axes,
+    grid: np.ndarray,
+    bbox: BBox,
+    log: bool = True,
+    cmap: str = "Purples",
+) -> AxesImage:
+    """Renders a density() grid, with north up and a true-to-scale aspect ratio."""
+    west, south, east, north = bbox
+    mid_lat = np.radians((south + north) / 2)
+    return ax.imshow(
+        to_image(grid, log),
+        origin="lower",
+        extent=(west, east, south, north),
+        aspect=1 / np.cos(mid_lat),  # a degree of longitude is short, at NYC
+        cmap=cmap,
+        interpolation="nearest",
+    )
@@ -0,0 +1,46 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+
+import numpy as np
+
+from constant.ch02_taxi.jh.raster import density, hour_dow_density, to_image
+
+BBOX = (-74.0, 40.7, -73.9, 40.8)
+
+
+class RasterTest(unittest.TestCase):
+    def test_density(self) -> None:
+        lng = np.array([-73.99, -73.99, -73.91, -73.8, np.nan])
+        lat = np.array([40.71, 40.71, 40.79, 40.75, 40.75])
+        grid = density(lng, lat, BBOX, shape=(2, 4))
+        # The last two points are outside the box, or unknown.
+        self.assertEqual([[2, 0, 0, 0], [0, 0, 0, 1]], grid.tolist())
+
+        rng = np.random.default_rng(0)
+        lng = rng.uniform(-74.0, -73.9, 10_000)
+        lat = rng.uniform(40.7, 40.8, 10_000)
+        expected, _, _ = np.histogram2d(
+            lat, lng, bins=(30, 40), range=[BBOX[1::2], BBOX[::2]]
+        )
+        self.assertEqual(expected.tolist(), density(lng, lat, BBOX, (30, 40)).tolist())
+
+    def test_hour_dow_density(self) -> None:
+        hour = np.array([6, 6, 23])
+        dow = np.array([0, 6, 6])
+        lng = np.array([-73.99, -73.91, -73.91])
+        lat = np.array([40.71, 40.79, 40.79])
+        grids = hour_dow_density(hour, dow, lng, lat, BBOX, shape=(2, 2))
+        self.assertEqual((24, 7, 2, 2), grids.shape)
+        self.assertEqual([[1, 0], [0, 1]], grids[6].sum(axis=0).tolist())
+        self.assertEqual([[0, 0], [0, 1]], grids[6, 6].tolist())
+        self.assertEqual([[0, 0], [0, 1]], grids[23, 6].tolist())
+        self.assertEqual(3, grids.sum())
+
+    def test_to_image(self) -> None:
+        grid = np.array([[0, 1], [50, 100]])
+        self.assertEqual([[0, 0.01], [0.5, 1]], to_image(grid, log=False).tolist())
+        grid = np.array([[0, 9], [9, 99]])
+        self.assertAlmostEqual(0.5, to_image(grid)[1, 0])  # log(10) / log(100)
+        self.assertEqual(0, to_image(np.zeros((2, 2))).max())
@@ -0,0 +1,124 @@
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Content-addressed cache of the columns that each ETL stage adds."""
+
+import hashlib
+import importlib
+import inspect
+import sys
+from logging import getLogger
+from pathlib import Path
+from types import CodeType, FunctionType, ModuleType
+from typing import Any, Callable
+
+import pandas as pd
+
+from constant.util.path import atomic_write, temp_dir
+
+log = getLogger(__name__)
+
+Stage = Callable[[pd.DataFrame], pd.DataFrame]
+
+
+class StageCache:
+    """Remembers the columns a stage added to a frame, as a parquet file per call.
+
+    The cache key covers the input frame's content, the source of every module
+    in PACKAGE that the stage's code reaches, and the content of any files it
+    depends on.  So an edit to a stage, or to a helper it calls, recomputes just
+    the stages that reach it, and everything else is a cache hit.
+    A stage must preserve rows, and only add columns.
+    """
+
+    def __init__(
+        self,
+        folder: Path = temp_dir() / "constant/stage_cache",
+        package: str = "constant",
+    ) -> None:
+        self.folder = folder
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.package = package
+
+    def apply(self, stage: Stage, df: pd.DataFrame, *depends_on: Path) -> pd.DataFrame:
+        name = inspect.unwrap(stage).__name__
+        key = self._key(stage, df, depends_on)
+        cache_file = self.folder / f"{name}-{key}.parquet"
+        if cache_file.exists():
+            added = pd.read_parquet(cache_file)
+            for col in added.columns:
+                df[col] = added[col].to_numpy()
+            return df
+
+        before, num_rows = set(df.columns), len(df)
+        df = stage(df)
+        assert len(df) == num_rows, name
+        added = df[[col for col in df.columns if col not in before]]
+        with atomic_write(cache_file) as temp_file:  # in case several workers race
+            added.to_parquet(temp_file, index=False)
+        log.debug(f"  cached {name} as {cache_file.name}")
+        return df
+
+    def _key(self, stage: Stage, df: pd.DataFrame, depends_on: tuple[Path, ...]) -> str:
+        h = hashlib.sha256()
+        for module in sorted(self._modules(stage), key=lambda m: m.__name__):
+            h.update(inspect.getsource(module).encode())
+        for dependency in depends_on:
+            h.update(dependency.read_bytes())
+        h.update(",".join(map(str, df.columns)).encode())
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        return h.hexdigest()[:16]
+
+    def _modules(self, stage: Stage) -> set[ModuleType]:
+        """Returns the modules holding code that STAGE might run, within PACKAGE.
+
+        Follows the names that each function's bytecode mentions, including
+        deferred imports and the methods of classes, so e.g. a stage calling
+        geodesic_distance() depends on the geodesic module's source.
+        Third-party code is not followed.
+        """
+        modules: set[ModuleType] = set()
+        seen: set[int] = set()
+        todo: list[Any] = [stage]
+        while todo:
+            obj = inspect.unwrap(todo.pop())
+            obj = getattr(obj, "__func__", obj)  # a bound method
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            if isinstance(obj, ModuleType):
+                if self._ours(obj.__name__):
+                    modules.add(obj)
+            elif self._ours(getattr(obj, "__module__", None)):
+                if inspect.isclass(obj):
+                    todo += vars(obj).values()
+                elif isinstance(obj, FunctionType):
+                    modules.add(sys.modules[obj.__module__])
+                    todo += self._referenced(obj)
+        return modules
+
+    def _referenced(self, func: FunctionType) -> list[Any]:
+        """Returns the objects that names in FUNC's code refer to."""
+        names: list[str] = []
+        codes = [func.__code__]
+        while codes:
+            code = codes.pop()
+            names += code.co_names
+            codes += [c for c in code.co_consts if isinstance(c, CodeType)]
+
+        found = [func.__globals__[name] for name in names if name in func.__globals__]
+        found += [
+            importlib.import_module(name)  # e.g. a deferred import
+            for name in names
+            if name.startswith(f"{self.package}.")
+        ]
+        for module in [obj for obj in found if isinstance(obj, ModuleType)]:
+            if self._ours(module.__name__):
+                found += [
+                    getattr(module, name) for name in names if hasattr(module, name)
+                ]
+        return found
+
+    def _ours(self, module_name: str | None) -> bool:
+        return module_name is not None and (
+            module_name in (self.package, "__main__")
+            or module_name.startswith(f"{self.package}.")
+        )
@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import importlib
+import sys
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+
+from constant.ch02_taxi.jh.etl import Etl
+from constant.ch02_taxi.jh.features import add_tlc_zone
+from constant.ch02_taxi.jh.stage_cache import StageCache
+
+STAGE_PY = """
+from stage_cache_demo.helper import scale
+
+calls = []
+
+
+def add_scaled(df):
+    calls.append(len(df))
+    df["scaled"] = scale(df.x)
+    return df
+"""
+
+
+class StageCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        temp = TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.temp = Path(temp.name)
+        package = self.temp / "stage_cache_demo"
+        package.mkdir()
+        (package / "__init__.py").write_text("")
+        (package / "stage.py").write_text(STAGE_PY)
+        self.helper_py = package / "helper.py"
+        self.helper_py.write_text("def scale(x):\n    return 2 * x\n")
+
+        sys.path.insert(0, str(self.temp))
+        self.addCleanup(sys.path.remove, str(self.temp))
+        for name in ["", ".helper", ".stage"]:
+            self.addCleanup(sys.modules.pop, f"stage_cache_demo{name}", None)
+        self.stage = importlib.import_module("stage_cache_demo.stage")
+        self.cache = StageCache(self.temp / "cache", package="stage_cache_demo")
+
+    def num_files(self) -> int:
+        return len(list(self.cache.folder.glob("*.parquet")))
+
+    def test_hit_and_miss(self) -> None:
+        df = pd.DataFrame({"x": [1, 2, 3]})
+        out = self.cache.apply(self.stage.add_scaled, df.copy())
+        self.assertEqual([2, 4, 6], list(out.scaled))
+
+        out = self.cache.apply(self.stage.add_scaled, df.copy())
+        self.assertEqual([2, 4, 6], list(out.scaled))
+        self.assertEqual([3], self.stage.calls)  # the second was a hit
+        self.assertEqual(1, self.num_files())
+
+        df = pd.DataFrame({"x": [1, 2, 4]})
+        out = self.cache.apply(self.stage.add_scaled, df)
+        self.assertEqual([2, 4, 8], list(out.scaled))
+        self.assertEqual([3, 3], self.stage.calls)
+        self.assertEqual(2, self.num_files())
+
+    def test_dependencies(self) -> None:
+        df = pd.DataFrame({"x": [1, 2, 3]})
+        dependency = self.temp / "zones.zip"
+        dependency.write_bytes(b"zones, v1")
+        self.cache.apply(self.stage.add_scaled, df.copy(), dependency)
+        self.cache.apply(self.stage.add_scaled, df.copy(), dependency)
+        self.assertEqual(1, len(self.stage.calls))
+
+        dependency.write_bytes(b"zones, v2")
+        self.cache.apply(self.stage.add_scaled, df.copy(), dependency)
+        self.assertEqual(2, len(self.stage.calls))
+
+        # Editing a helper, rather than the stage itself, also invalidates.
+        self.helper_py.write_text("def scale(x):\n    return x + x + x\n")
+        importlib.reload(sys.modules["stage_cache_demo.helper"])
+        self.stage = importlib.reload(self.stage)
+        out = self.cache.apply(self.stage.add_scaled, df.copy(), dependency)
+        self.assertEqual([3, 6, 9], list(out.scaled))
+        self.assertEqual([3], self.stage.calls)
+        self.assertEqual(3, self.num_files())
+
+    def test_modules(self) -> None:
+        cache = StageCache(self.cache.folder)
+        names = {m.__name__ for m in cache._modules(Etl._add_direction_and_distance)}
+        self.assertIn("constant.ch02_taxi.jh.features", names)
+        names = {m.__name__ for m in cache._modules(add_tlc_zone)}
+        self.assertIn("constant.ch02_taxi.jh.zones", names)  # a deferred import
+        self.assertNotIn("pandas", names)
@@ -0,0 +1,94 @@
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Synthetic trips and taxi zones, for tests and benchmarks at any scale."""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import box
+
+from constant.ch02_taxi.jh.dataset import BBox
+from constant.ch02_taxi.jh.etl import OutlierFilter, _read_yaml_bbox
+from constant.ch02_taxi.jh.features import grand_central_nyc
+from constant.ch02_taxi.jh.geodesic import haversine_distance
+from constant.ch02_taxi.jh.zones import WGS_84
+
+NYC_BBOX: BBox = (-74.25, 40.50, -73.70, 40.90)
+
+
+def taxi_bbox() -> BBox:
+    """Returns the service area of taxi.yml, as (west, south, east, north)."""
+    (n_lat, w_lng), (s_lat, e_lng) = _read_yaml_bbox()
+    return w_lng, s_lat, e_lng, n_lat
+
+
+def synthetic_zones(step: float = 0.05, bbox: BBox = NYC_BBOX) -> gpd.GeoDataFrame:
+    """Returns a grid of square "zones" covering the BBOX, much of NYC by default."""
+    boroughs = ["Manhattan", "Brooklyn", "Queens", "Bronx", "Staten Island"]
+    west, south, east, north = bbox
+    squares = [
+        box(lng, lat, lng + step, lat + step)
+        for lng in np.arange(west, east, step)
+        for lat in np.arange(south, north, step)
+    ]
+    return gpd.GeoDataFrame(
+        {
+            "borough": [boroughs[i % len(boroughs)] for i in range(len(squares))],
+            "zone": [f"Zone {i}" for i in range(len(squares))],
+        },
+        geometry=squares,
+        crs=WGS_84,
+    )
+
+
+def synthetic_trips(
+    num_rows: int, seed: int = 0, outlier_rate: float = 0.002
+) -> pd.DataFrame:
+    """Returns trips shaped like the Kaggle CSV, once its unhelpful columns are gone.
+
+    Most trips start and end near midtown, and the rest anywhere in taxi.yml's
+    bounding box.  An OUTLIER_RATE of them leave the meter running for a day,
+    and as many again wander far outside the box.
+    """
+    rng = np.random.default_rng(seed)
+    west, south, east, north = taxi_bbox()
+
+    def locations() -> tuple[np.ndarray, np.ndarray]:
+        lat = rng.normal(grand_central_nyc[0], 0.03, num_rows)
+        lng = rng.normal(grand_central_nyc[1], 0.03, num_rows)
+        anywhere = rng.random(num_rows) < 0.15
+        lat[anywhere] = rng.uniform(south, north, anywhere.sum())
+        lng[anywhere] = rng.uniform(west, east, anywhere.sum())
+        margin = 1e-3  # the outlier filter's bounds are exclusive
+        lat = lat.clip(south + margin, north - margin)
+        lng = lng.clip(west + margin, east - margin)
+        return lat, lng
+
+    pickup_lat, pickup_lng = locations()
+    dropoff_lat, dropoff_lng = locations()
+    stray = rng.random(num_rows) < outlier_rate
+    dropoff_lat[stray] += 5  # well north of the service area
+
+    meters = haversine_distance(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng)
+    speed = rng.uniform(3, 12, num_rows)  # m/s
+    duration = (60 + meters / speed).clip(None, 3 * 3600).astype(np.int64)
+    meter_left_running = rng.random(num_rows) < outlier_rate
+    duration[meter_left_running] = OutlierFilter.FOUR_HOURS + 80_000
+
+    pickup = pd.Timestamp("2016-01-01") + pd.to_timedelta(
+        rng.integers(0, 182 * 86_400, num_rows), unit="s"
+    )
+    return pd.DataFrame(
+        {
+            "id": "id" + pd.Series(np.arange(num_rows)).astype(str),
+            "pickup_datetime": pickup,
+            "dropoff_datetime": pickup + pd.to_timedelta(duration, unit="s"),
+            "passenger_count": rng.choice(
+                [1, 2, 3, 4, 5, 6], num_rows, p=[0.7, 0.14, 0.04, 0.02, 0.06, 0.04]
+            ),
+            "pickup_longitude": pickup_lng,
+            "pickup_latitude": pickup_lat,
+            "dropoff_longitude": dropoff_lng,
+            "dropoff_latitude": dropoff_lat,
+            "trip_duration": duration,
+        }
+    )
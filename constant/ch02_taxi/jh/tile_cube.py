@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Precomputed trip counts by hour × day-of-week × grid cell, for interactive maps.
+
+Built once from the dataset and saved as a compressed .npz, the cube lets
+a map of any hour, or any hour of a given weekday, be a mere slice.
+"""
+
+from logging import getLogger
+from pathlib import Path
+
+import numpy as np
+import typer
+
+from constant.ch02_taxi.jh.dataset import BBox, in_bbox, is_fresh, load_trips
+from constant.ch02_taxi.jh.features import COMPRESSED_DATASET
+from constant.ch02_taxi.jh.raster import TIGHT_BBOX, Shape, hour_dow_density
+from constant.util.logger import configure_logging
+from constant.util.path import temp_dir
+
+TILE_CUBE = temp_dir() / "constant/dropoff_cube.npz"
+
+log = getLogger(__name__)
+
+
+def build_cube(
+    out_file: Path = TILE_CUBE,
+    in_file: Path = COMPRESSED_DATASET,
+    end: str = "dropoff",
+    bbox: BBox = TIGHT_BBOX,
+    shape: Shape = (256, 320),
+) -> Path:
+    """Counts every trip's pickup or dropoff END, within BBOX, into a cube."""
+    lng, lat = f"{end}_longitude", f"{end}_latitude"
+    df = load_trips(["hour", "dow", lng, lat], in_bbox(bbox, end), in_file=in_file)
+    columns = (df[col].to_numpy() for col in ["hour", "dow", lng, lat])
+    counts = hour_dow_density(*columns, bbox, shape)
+    assert counts.max(initial=0) < 2**32
+    np.savez_compressed(out_file, counts=counts.astype(np.uint32), bbox=bbox)
+    log.info(f"  {len(df):_} {end}s binned into {out_file}")
+    return out_file
+
+
+def load_cube(
+    in_file: Path = TILE_CUBE, dataset: Path = COMPRESSED_DATASET
+) -> tuple[np.ndarray, BBox]:
+    """Returns the counts, indexed [hour, dow, row, column], and their bounding box.
+
+    The cube is (re)built first if the dataset is newer.
+    """
+    if not is_fresh(in_file, dataset):
+        build_cube(in_file, dataset)
+    with np.load(in_file) as npz:
+        west, south, east, north = map(float, npz["bbox"])
+        return npz["counts"], (west, south, east, north)
+
+
+def main(out_file: Path = TILE_CUBE, in_file: Path = COMPRESSED_DATASET) -> None:
+    build_cube(out_file, in_file)
+
+
+if __name__ == "__main__":
+    configure_logging()
+    typer.run(main)
@@ -0,0 +1,36 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+
+from constant.ch02_taxi.jh.dataset import TripDatasetWriter
+from constant.ch02_taxi.jh.raster import TIGHT_BBOX
+from constant.ch02_taxi.jh.tile_cube import load_cube
+
+
+class TileCubeTest(unittest.TestCase):
+    def test_load_cube(self) -> None:
+        pickup = pd.date_range("2016-01-04 06:00", periods=3, freq="D")  # Mon..Wed
+        df = pd.DataFrame(
+            {
+                "pickup_datetime": pickup,
+                "dow": pickup.dayofweek,
+                "hour": pickup.hour,
+                "dropoff_longitude": [-73.98, -73.98, -72.0],  # the last is outside
+                "dropoff_latitude": [40.75, 40.75, 40.75],
+            }
+        )
+        with TemporaryDirectory() as temp:
+            dataset = Path(temp) / "trip.parquet"
+            with TripDatasetWriter(dataset) as writer:
+                writer.write(df)
+
+            counts, bbox = load_cube(Path(temp) / "cube.npz", dataset)  # builds it
+            self.assertEqual(TIGHT_BBOX, bbox)
+            self.assertEqual((24, 7), counts.shape[:2])
+            self.assertEqual(2, counts.sum())
+            self.assertEqual([1, 1, 0], [counts[6, dow].sum() for dow in range(3)])
@@ -1,23 +1,146 @@
 #! /usr/bin/env python
 # Copyright 2023 O1 Software Network. MIT licensed.
 
+import os
+from datetime import datetime
+from logging import getLogger
 from pathlib import Path
+from time import time
+from typing import Any, Callable
 
-import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import typer
+import xgboost as xgb
 from beartype import beartype
 
+from constant.ch02_taxi.jh.dataset import trip_dataset
 from constant.ch02_taxi.jh.features import COMPRESSED_DATASET
+from constant.ch02_taxi.jh.predict import MODEL_DIR, save_model
+from constant.util.logger import configure_logging
+
+FEATURES = [
+    "distance",
+    "direction",
+    "passenger_count",
+    "dow",
+    "hour",
+    "pickup_longitude",
+    "pickup_latitude",
+    "dropoff_longitude",
+    "dropoff_latitude",
+]
+TARGET = "trip_duration"
+
+log = getLogger(__name__)
+
+
+class TripBatches(xgb.DataIter):
+    """Streams record batches of trips from the parquet dataset into XGBoost.
+
+    Each batch becomes a float32 feature matrix of just BATCH_SIZE rows,
+    so the full dataset is never materialized, let alone as float64.
+    The label is log(1 + trip_duration), so squared error is RMSLE.
+    """
+
+    def __init__(
+        self,
+        where: ds.Expression,
+        in_file: Path = COMPRESSED_DATASET,
+        batch_size: int = 256 * 1024,
+    ) -> None:
+        super().__init__()
+        self.scanner_args = dict(
+            columns=FEATURES + [TARGET], filter=where, batch_size=batch_size
+        )
+        self.dataset = trip_dataset(in_file)
+        self.reset()
+
+    def reset(self) -> None:
+        self.batches = self.dataset.to_batches(**self.scanner_args)
+
+    def next(self, input_data: Callable[..., None]) -> bool:
+        batch = next(self.batches, None)
+        if batch is None:
+            return False
+        features, label = features_and_label(batch)
+        input_data(data=features, label=label, feature_names=FEATURES)
+        return True
+
+
+def features_and_label(batch: pa.RecordBatch) -> tuple[np.ndarray, np.ndarray]:
+    """Returns a float32 matrix of FEATURES, and log(1 + trip_duration)."""
+    columns = [batch[name].to_numpy(zero_copy_only=False) for name in FEATURES]
+    features = np.column_stack(columns).astype(np.float32, copy=False)
+    label = np.log1p(batch[TARGET].to_numpy(zero_copy_only=False))
+    return features, label
 
 
 @beartype
-def train_duration_model(df: pd.DataFrame) -> None:
-    """Train a model to predict trip duration."""
-    print(df)
+def train_duration_model(
+    in_file: Path = COMPRESSED_DATASET,
+    valid_from: datetime = datetime(2016, 6, 1),
+    num_boost_round: int = 2000,
+    early_stopping_rounds: int = 50,
+    params: dict[str, Any] | None = None,
+) -> xgb.Booster:
+    """Train a model to predict trip duration.
+
+    Trips that start before VALID_FROM are for training, and later ones
+    for validation, which stops training once it ceases to improve.
+    """
+    params = {
+        "tree_method": "hist",
+        "objective": "reg:squarederror",
+        "eval_metric": "rmse",
+        "learning_rate": 0.1,
+        "max_depth": 10,
+        "nthread": os.cpu_count(),
+    } | (params or {})
+    pickup = ds.field("pickup_datetime")
+    train_batches = TripBatches(pickup < valid_from, in_file)
+    valid_batches = TripBatches(pickup >= valid_from, in_file)
+
+    t0 = time()
+    dtrain = xgb.QuantileDMatrix(train_batches, max_bin=256)
+    dvalid = xgb.QuantileDMatrix(valid_batches, ref=dtrain)
+    n_train, n_valid = dtrain.num_row(), dvalid.num_row()
+    elapsed = time() - t0
+    log.info(
+        f"  quantized {n_train:_} training and {n_valid:_} validation trips"
+        f" in {elapsed:.1f} s, {(n_train + n_valid) / elapsed:,.0f} trips/s"
+    )
+
+    t0 = time()
+    booster = xgb.train(
+        params,
+        dtrain,
+        num_boost_round,
+        evals=[(dtrain, "train"), (dvalid, "valid")],
+        early_stopping_rounds=early_stopping_rounds,
+        verbose_eval=100,
+    )
+    elapsed = time() - t0
+    rounds = booster.num_boosted_rounds()
+    log.info(
+        f"  trained {rounds} rounds in {elapsed:.1f} s,"
+        f" {n_train * rounds / elapsed:,.0f} trip-rounds/s;"
+        f" best validation RMSLE {booster.best_score:.4f}"
+        f" after {booster.best_iteration + 1} rounds"
+    )
+    return booster
 
 
-def main(in_file: Path = COMPRESSED_DATASET) -> None:
-    train_duration_model(pd.read_parquet(in_file))
+def main(
+    in_file: Path = COMPRESSED_DATASET,
+    num_boost_round: int = 2000,
+    model_dir: Path = MODEL_DIR,
+) -> None:
+    booster = train_duration_model(in_file, num_boost_round=num_boost_round)
+    save_model(booster, FEATURES, model_dir, trained_on=in_file)
 
 
 if __name__ == "__main__":
-    main()
+    configure_logging()
+    typer.run(main)
@@ -0,0 +1,42 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
+
+from constant.ch02_taxi.jh.dataset import TripDatasetWriter
+from constant.ch02_taxi.jh.train import FEATURES, train_duration_model
+
+
+class TrainTest(unittest.TestCase):
+    def test_train_duration_model(self) -> None:
+        rng = np.random.default_rng(0)
+        n = 20_000
+        pickup = pd.Timestamp("2016-05-01") + pd.to_timedelta(
+            np.sort(rng.uniform(0, 61 * 86_400, n)), unit="s"
+        )
+        df = pd.DataFrame({col: rng.uniform(0, 1, n) for col in FEATURES})
+        df["distance"] = rng.uniform(500, 20_000, n)
+        df["pickup_datetime"] = pickup
+        df["trip_duration"] = (df.distance / 8).astype(int)  # about 18 mph
+
+        with TemporaryDirectory() as temp:
+            dataset = Path(temp) / "trip.parquet"
+            with TripDatasetWriter(dataset) as writer:
+                writer.write(df)
+            booster = train_duration_model(
+                dataset,
+                valid_from=datetime(2016, 6, 1),
+                num_boost_round=500,
+                early_stopping_rounds=5,
+                params=dict(max_depth=4, nthread=2),
+            )
+
+        self.assertLess(booster.best_score, 0.05)  # RMSLE
+        self.assertLess(booster.num_boosted_rounds(), 500)  # stopped early
+        self.assertEqual(FEATURES, booster.feature_names)
@@ -0,0 +1,274 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Hyperparameter search for the duration model, with time-series cross-validation.
+
+The feature matrix is built once, sorted by pickup time, and saved as .npy
+files.  Worker processes memory-map them, so they share one copy in the page
+cache, and each fold is just a slice.  Successive halving gives every sampled
+configuration a few boosting rounds, then spends more rounds on the best
+third, and so on.  Every trial lands in a SQLite table of results.
+"""
+
+import json
+import os
+import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from logging import getLogger
+from multiprocessing import get_context
+from pathlib import Path
+from time import time
+from typing import Any, NamedTuple
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+import typer
+import xgboost as xgb
+from numpy.lib.format import open_memmap
+
+from constant.ch02_taxi.jh.dataset import is_fresh, trip_dataset
+from constant.ch02_taxi.jh.features import COMPRESSED_DATASET
+from constant.ch02_taxi.jh.train import FEATURES, TARGET, features_and_label
+from constant.util.logger import configure_logging, init_worker_logging, log_queue
+from constant.util.path import temp_dir
+
+FEATURE_MATRIX = temp_dir() / "constant/feature_matrix"
+TUNING_DB = temp_dir() / "constant/tuning.db"
+
+SEARCH_SPACE: dict[str, list[Any]] = {
+    "max_depth": [6, 8, 10, 12],
+    "learning_rate": [0.05, 0.1, 0.2],
+    "min_child_weight": [1, 10, 100],
+    "subsample": [0.7, 0.85, 1.0],
+    "colsample_bytree": [0.6, 0.8, 1.0],
+    "reg_lambda": [0.1, 1, 10],
+}
+
+log = getLogger(__name__)
+
+
+class FeatureMatrix(NamedTuple):
+    x: np.ndarray  # float32 FEATURES, one row per trip, in order of pickup
+    y: np.ndarray  # log(1 + trip_duration)
+    pickup: np.ndarray  # datetime64
+
+
+def build_feature_matrix(
+    out_dir: Path = FEATURE_MATRIX, in_file: Path = COMPRESSED_DATASET
+) -> None:
+    """Streams the dataset into .npy files, with rows sorted by pickup time.
+
+    Only the pickup column is read whole, to find each row's sorted position.
+    """
+    dataset = trip_dataset(in_file)
+    pickup = dataset.to_table(columns=["pickup_datetime"]).column(0).to_numpy()
+    order = np.argsort(pickup, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    work_dir = out_dir.with_suffix(".tmp")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    work_dir.mkdir(parents=True)
+    shape = (len(pickup), len(FEATURES))
+    x = open_memmap(work_dir / "x.npy", "w+", np.float32, shape)
+    y = open_memmap(work_dir / "y.npy", "w+", np.float32, shape[:1])
+    offset = 0
+    for batch in dataset.to_batches(columns=FEATURES + [TARGET]):
+        rows = rank[offset : offset + batch.num_rows]
+        x[rows], y[rows] = features_and_label(batch)
+        offset += batch.num_rows
+    assert offset == len(pickup)
+    x.flush()
+    y.flush()
+    np.save(work_dir / "pickup.npy", pickup[order])
+    (work_dir / "manifest.json").write_text(json.dumps(dict(features=FEATURES)))
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    work_dir.rename(out_dir)
+    log.info(f"  built a {shape[0]:_} x {shape[1]} feature matrix in {out_dir}")
+
+
+def load_feature_matrix(
+    matrix_dir: Path = FEATURE_MATRIX, in_file: Path = COMPRESSED_DATASET
+) -> FeatureMatrix:
+    """Memory-maps the feature matrix, first (re)building it if it is stale."""
+    manifest = matrix_dir / "manifest.json"
+    if not (
+        is_fresh(manifest, in_file)
+        and json.loads(manifest.read_text())["features"] == FEATURES
+    ):
+        build_feature_matrix(matrix_dir, in_file)
+    return open_feature_matrix(matrix_dir)
+
+
+def open_feature_matrix(matrix_dir: Path = FEATURE_MATRIX) -> FeatureMatrix:
+    x, y, pickup = (
+        np.load(matrix_dir / f"{name}.npy", mmap_mode="r")
+        for name in FeatureMatrix._fields
+    )
+    return FeatureMatrix(x, y, pickup)
+
+
+def time_series_folds(num_rows: int, n_splits: int = 3) -> list[tuple[slice, slice]]:
+    """Returns (train, valid) slices of time-sorted rows, for expanding windows.
+
+    The rows are cut into N_SPLITS + 1 blocks.  Each fold trains on every
+    block up to some point in time, and validates on the block that follows.
+    """
+    edges = np.linspace(0, num_rows, n_splits + 2).astype(int).tolist()
+    return [
+        (slice(0, edges[k]), slice(edges[k], edges[k + 1]))
+        for k in range(1, n_splits + 1)
+    ]
+
+
+def sample_params(
+    space: dict[str, list[Any]], num_trials: int, seed: int = 0
+) -> list[dict[str, Any]]:
+    """Returns NUM_TRIALS distinct random configurations from the SPACE grid."""
+    rng = random.Random(seed)
+    size = int(np.prod([len(choices) for choices in space.values()]))
+    configs: dict[str, dict[str, Any]] = {}
+    while len(configs) < min(num_trials, size):
+        params = {name: rng.choice(choices) for name, choices in space.items()}
+        configs.setdefault(json.dumps(params), params)
+    return list(configs.values())
+
+
+# Each worker process memory-maps the matrix, and quantizes each fold once.
+_matrix: FeatureMatrix
+_folds: list[tuple[slice, slice]]
+_dmatrices: dict[int, tuple[xgb.QuantileDMatrix, xgb.QuantileDMatrix]] = {}
+
+
+def _init_worker(matrix_dir: Path, n_splits: int, queue: Any) -> None:
+    global _matrix, _folds
+    init_worker_logging(queue)
+    _matrix = open_feature_matrix(matrix_dir)
+    _folds = time_series_folds(len(_matrix.y), n_splits)
+
+
+def _fold(k: int) -> tuple[xgb.QuantileDMatrix, xgb.QuantileDMatrix]:
+    if k not in _dmatrices:
+        x, y, _ = _matrix
+        train, valid = _folds[k]
+        dtrain = xgb.QuantileDMatrix(x[train], y[train], feature_names=FEATURES)
+        dvalid = xgb.QuantileDMatrix(
+            x[valid], y[valid], ref=dtrain, feature_names=FEATURES
+        )
+        _dmatrices[k] = dtrain, dvalid
+    return _dmatrices[k]
+
+
+def _evaluate(
+    params: dict[str, Any], num_boost_round: int, early_stopping_rounds: int
+) -> tuple[float, int, float]:
+    """Returns mean validation RMSLE over the folds, mean best rounds, and seconds."""
+    t0 = time()
+    scores, rounds = [], []
+    for k in range(len(_folds)):
+        dtrain, dvalid = _fold(k)
+        booster = xgb.train(
+            params,
+            dtrain,
+            num_boost_round,
+            evals=[(dvalid, "valid")],
+            early_stopping_rounds=early_stopping_rounds,
+            verbose_eval=False,
+        )
+        scores.append(booster.best_score)
+        rounds.append(booster.best_iteration + 1)
+    return float(np.mean(scores)), round(np.mean(rounds)), time() - t0
+
+
+def successive_halving(
+    space: dict[str, list[Any]] = SEARCH_SPACE,
+    num_trials: int = 27,
+    min_rounds: int = 50,
+    max_rounds: int = 2000,
+    eta: int = 3,
+    n_splits: int = 3,
+    workers: int = max(1, (os.cpu_count() or 1) // 4),
+    study: str | None = None,
+    matrix_dir: Path = FEATURE_MATRIX,
+    in_file: Path = COMPRESSED_DATASET,
+    db_file: Path = TUNING_DB,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Searches SPACE, keeping the best 1 / ETA of trials for each next rung.
+
+    Rung r trains for MIN_ROUNDS * ETA ** r rounds, at most MAX_ROUNDS,
+    with early stopping, on every fold.  Returns the trials of the last rung,
+    best first.  All rungs are appended to the trial table in DB_FILE.
+    """
+    study = study or datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    load_feature_matrix(matrix_dir, in_file)  # build it before the workers start
+    base_params = {
+        "tree_method": "hist",
+        "objective": "reg:squarederror",
+        "eval_metric": "rmse",
+        "nthread": max(1, (os.cpu_count() or 1) // workers),
+    }
+    configs = sample_params(space, num_trials, seed)
+    survivors = list(range(len(configs)))
+    engine = sa.create_engine(f"sqlite:///{db_file}", echo=False)
+    rung, num_rounds = 0, min_rounds
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=get_context("spawn"),  # fork is unsafe once OpenMP has started
+        initializer=_init_worker,
+        initargs=(matrix_dir, n_splits, log_queue()),
+    ) as pool:
+        while True:
+            futures = [
+                pool.submit(
+                    _evaluate,
+                    base_params | configs[i],
+                    num_rounds,
+                    max(10, num_rounds // 10),
+                )
+                for i in survivors
+            ]
+            results = pd.DataFrame(
+                [f.result() for f in futures], columns=["rmsle", "rounds", "elapsed"]
+            )
+            results.insert(0, "study", study)
+            results.insert(1, "trial", survivors)
+            results.insert(2, "rung", rung)
+            results.insert(3, "num_boost_round", num_rounds)
+            results["params"] = [json.dumps(configs[i]) for i in survivors]
+            results = results.sort_values("rmsle", ignore_index=True)
+            results.to_sql("trial", engine, if_exists="append", index=False)
+            best = results.iloc[0]
+            log.info(
+                f"  rung {rung}: {len(results)} trials of {num_rounds} rounds,"
+                f" best RMSLE {best.rmsle:.4f} from {best.params}"
+            )
+            if len(results) <= 1 or num_rounds * eta > max_rounds:
+                return results
+            survivors = results.trial[: max(1, len(results) // eta)].tolist()
+            rung, num_rounds = rung + 1, num_rounds * eta
+
+
+def main(
+    num_trials: int = 27,
+    workers: int = max(1, (os.cpu_count() or 1) // 4),
+    study: str = "",
+    in_file: Path = COMPRESSED_DATASET,
+    db_file: Path = TUNING_DB,
+) -> None:
+    configure_logging(processes=True)
+    results = successive_halving(
+        num_trials=num_trials,
+        workers=workers,
+        study=study or None,
+        in_file=in_file,
+        db_file=db_file,
+    )
+    print(results.to_string())
+
+
+if __name__ == "__main__":
+    typer.run(main)
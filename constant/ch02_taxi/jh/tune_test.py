@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import json
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+from constant.ch02_taxi.jh.dataset import TripDatasetWriter
+from constant.ch02_taxi.jh.train import FEATURES
+from constant.ch02_taxi.jh.tune import (
+    load_feature_matrix,
+    sample_params,
+    successive_halving,
+    time_series_folds,
+)
+
+
+class TuneTest(unittest.TestCase):
+    def setUp(self) -> None:
+        rng = np.random.default_rng(0)
+        n = 6_000
+        pickup = pd.Timestamp("2016-01-01") + pd.to_timedelta(
+            rng.uniform(0, 121 * 86_400, n), unit="s"
+        )
+        self.df = pd.DataFrame({col: rng.uniform(0, 1, n) for col in FEATURES})
+        self.df["distance"] = rng.uniform(500, 20_000, n)
+        self.df["pickup_datetime"] = pickup
+        self.df["trip_duration"] = (self.df.distance / 8).astype(int)
+
+        self.temp = TemporaryDirectory()
+        self.dataset = Path(self.temp.name) / "trip.parquet"
+        self.matrix_dir = Path(self.temp.name) / "feature_matrix"
+        with TripDatasetWriter(self.dataset) as writer:
+            writer.write(self.df)
+
+    def tearDown(self) -> None:
+        self.temp.cleanup()
+
+    def test_feature_matrix(self) -> None:
+        x, y, pickup = load_feature_matrix(self.matrix_dir, self.dataset)
+        mtime = (self.matrix_dir / "x.npy").stat().st_mtime
+        load_feature_matrix(self.matrix_dir, self.dataset)  # fresh, so not rebuilt
+        self.assertEqual(mtime, (self.matrix_dir / "x.npy").stat().st_mtime)
+
+        self.assertEqual((len(self.df), len(FEATURES)), x.shape)
+        self.assertEqual(np.float32, x.dtype)
+        self.assertTrue((np.diff(pickup) >= np.timedelta64(0)).all())
+        expected = self.df.sort_values("pickup_datetime")
+        np.testing.assert_allclose(expected.distance, x[:, 0], rtol=1e-6)
+        np.testing.assert_allclose(np.log1p(expected.trip_duration), y, rtol=1e-6)
+
+    def test_time_series_folds(self) -> None:
+        folds = time_series_folds(100, n_splits=3)
+        self.assertEqual(
+            [
+                (slice(0, 25), slice(25, 50)),
+                (slice(0, 50), slice(50, 75)),
+                (slice(0, 75), slice(75, 100)),
+            ],
+            folds,
+        )
+
+    def test_sample_params(self) -> None:
+        space = dict(max_depth=[4, 6], learning_rate=[0.1, 0.3])
+        self.assertEqual(4, len(sample_params(space, 10)))
+        self.assertEqual(3, len({json.dumps(p) for p in sample_params(space, 3)}))
+
+    def test_successive_halving(self) -> None:
+        db_file = Path(self.temp.name) / "tuning.db"
+        space = dict(max_depth=[2, 4], learning_rate=[0.05, 0.3])
+        results = successive_halving(
+            space,
+            num_trials=4,
+            min_rounds=10,
+            max_rounds=40,
+            eta=2,
+            workers=2,
+            study="test",
+            matrix_dir=self.matrix_dir,
+            in_file=self.dataset,
+            db_file=db_file,
+        )
+        self.assertEqual(1, len(results))  # rungs of 4, 2, then 1 trials
+        self.assertLess(results.rmsle[0], 0.1)
+
+        trials = pd.read_sql_table("trial", sa.create_engine(f"sqlite:///{db_file}"))
+        self.assertEqual([4, 2, 1], trials.groupby("rung").size().tolist())
+        self.assertEqual([10, 20, 40], sorted(trials.num_boost_round.unique()))
+        self.assertEqual({"test"}, set(trials.study))
@@ -0,0 +1,150 @@
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Point-in-polygon lookup of NYC TLC taxi zones."""
+
+import hashlib
+import math
+from functools import cache
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from pyproj import Transformer
+
+from constant.ch02_taxi.jh.features import TLC_ZONE_SHAPEFILE
+from constant.util.path import atomic_write
+
+WGS_84 = "EPSG:4326"
+NY_LONG_ISLAND = "EPSG:2263"  # https://epsg.io/2263 NAD83 / New York L.I., in feet
+
+NO_ZONE = -1
+
+
+@cache
+def tlc_zone_index(cell_size: float | None = 500) -> "TlcZoneIndex":
+    """Returns the process-wide index of TLC zones, built on first use."""
+    return TlcZoneIndex(tlc_zone_shapes(), cell_size)
+
+
+def tlc_zone_shapes(in_file: Path = TLC_ZONE_SHAPEFILE) -> gpd.GeoDataFrame:
+    """Returns the TLC zone polygons, projected to NY_LONG_ISLAND.
+
+    Parsing and reprojecting the shapefile is slow, so the result is
+    cached as GeoParquet, keyed by a hash of the zipped shapefile.
+    """
+    digest = hashlib.sha256(in_file.read_bytes()).hexdigest()[:16]
+    cache_file = in_file.with_name(f"{in_file.stem}-{digest}.parquet")
+    if cache_file.exists():
+        return gpd.read_parquet(cache_file)
+
+    zones = gpd.read_file(in_file).to_crs(NY_LONG_ISLAND)
+    with atomic_write(cache_file) as temp_file:  # in case several workers race
+        zones.to_parquet(temp_file)
+    return zones
+
+
+class TlcZoneIndex:
+    """Maps arrays of (lng, lat) points to the borough and zone that contains them.
+
+    The zone polygons are projected, prepared, and put in an STRtree just once,
+    so an index can serve many lookups.  Given a CELL_SIZE (in feet), it also
+    remembers which grid cells lie wholly within a single zone, so points
+    in an already seen cell are resolved without any polygon test.
+    """
+
+    def __init__(self, zones: gpd.GeoDataFrame, cell_size: float | None = None) -> None:
+        zones = zones.to_crs(NY_LONG_ISLAND)
+        assert zones.crs.is_projected
+        # A trailing None lets NO_ZONE index these arrays, meaning "no match".
+        self.boroughs = np.append(zones.borough.to_numpy(dtype=object), [None])
+        self.zones = np.append(zones.zone.to_numpy(dtype=object), [None])
+        self.polygons = np.asarray(zones.geometry.values)
+        shapely.prepare(self.polygons)
+        self.tree = shapely.STRtree(self.polygons)
+        self.to_ny = Transformer.from_crs(WGS_84, NY_LONG_ISLAND, always_xy=True)
+
+        self.cell_size = cell_size
+        self.cells: dict[int, int] = {}  # maps grid cell to zone, or to NO_ZONE
+
+    def lookup(self, lng: np.ndarray, lat: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (borough, zone) name arrays, with None where no zone matched."""
+        i = self.lookup_indices(lng, lat)
+        return self.boroughs[i], self.zones[i]
+
+    def lookup_indices(self, lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        """Returns the index of the zone containing each point, or NO_ZONE."""
+        x, y = self.to_ny.transform(np.asarray(lng), np.asarray(lat))
+        x, y = np.atleast_1d(x), np.atleast_1d(y)
+        if self.cell_size is None:
+            return self._query(x, y)
+
+        keys = self._cell_keys(x, y)
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        i = self._cell_zones(uniq)[inverse.ravel()]
+
+        boundary = i == NO_ZONE
+        i[boundary] = self._query(x[boundary], y[boundary])
+        return i
+
+    def lookup_point(self, lng: float, lat: float) -> tuple[str | None, str | None]:
+        """Returns the (borough, zone) of a single point, in microseconds.
+
+        This skips the array machinery of lookup() when the point's grid cell
+        has already been resolved to one zone, which is the common case.
+        """
+        i = NO_ZONE
+        if self.cell_size is not None:
+            x, y = self.to_ny.transform(lng, lat)
+            if math.isfinite(x) and math.isfinite(y):
+                key = self._cell_key(x, y)
+                i = self.cells.get(key, NO_ZONE)
+        if i == NO_ZONE:
+            i = int(self.lookup_indices(np.array([lng]), np.array([lat]))[0])
+        return self.boroughs[i], self.zones[i]
+
+    def _query(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Finds the zone that each point intersects, preferring the lowest index."""
+        n = len(self.polygons)
+        i = np.full(len(x), n, dtype=np.int64)
+        point_i, zone_i = self.tree.query(shapely.points(x, y), predicate="intersects")
+        np.minimum.at(i, point_i, zone_i)
+        i[i == n] = NO_ZONE
+        return i
+
+    # A cell key packs a pair of signed 32-bit grid coordinates into an int64.
+    _HALF = 1 << 31
+
+    def _cell_keys(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        assert self.cell_size
+        ix, iy = (
+            np.nan_to_num(np.floor(v / self.cell_size), nan=-self._HALF)
+            .clip(-self._HALF, self._HALF - 1)
+            .astype(np.int64)
+            for v in (x, y)
+        )
+        keys: np.ndarray = ix << 32 | (iy + self._HALF)
+        return keys
+
+    def _cell_key(self, x: float, y: float) -> int:
+        """The scalar twin of _cell_keys(), for a finite point."""
+        assert self.cell_size
+        ix, iy = (
+            min(max(math.floor(v / self.cell_size), -self._HALF), self._HALF - 1)
+            for v in (x, y)
+        )
+        return ix << 32 | (iy + self._HALF)
+
+    def _cell_zones(self, keys: np.ndarray) -> np.ndarray:
+        """Returns the zone wholly containing each cell, or NO_ZONE if there is none."""
+        assert self.cell_size
+        new = np.array([k for k in keys.tolist() if k not in self.cells], np.int64)
+        if len(new):
+            x0 = (new >> 32) * self.cell_size
+            y0 = ((new & 0xFFFF_FFFF) - self._HALF) * self.cell_size
+            cells = shapely.box(x0, y0, x0 + self.cell_size, y0 + self.cell_size)
+            zone = np.full(len(new), NO_ZONE, dtype=np.int64)
+            cell_i, zone_i = self.tree.query(cells, predicate="within")
+            zone[cell_i] = zone_i
+            self.cells.update(zip(new.tolist(), zone.tolist()))
+
+        return np.array([self.cells[k] for k in keys.tolist()], dtype=np.int64)
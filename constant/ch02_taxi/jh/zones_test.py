@@ -0,0 +1,53 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+
+import geopandas as gpd
+import numpy as np
+
+from constant.ch02_taxi.jh.synthetic import synthetic_zones
+from constant.ch02_taxi.jh.zones import NO_ZONE, WGS_84, TlcZoneIndex
+
+
+class TlcZoneIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        rng = np.random.default_rng(seed=42)
+        n = 10_000
+        self.lng = rng.uniform(-74.3, -73.65, n)  # a few points lie outside the grid
+        self.lat = rng.uniform(40.45, 40.95, n)
+        self.zones = synthetic_zones()
+
+    def test_matches_sjoin(self) -> None:
+        points = gpd.GeoDataFrame(
+            geometry=gpd.points_from_xy(self.lng, self.lat), crs=WGS_84
+        ).to_crs(epsg=2263)
+        joined = points.sjoin(self.zones.to_crs(epsg=2263), how="left")
+        joined = joined[~joined.index.duplicated()]
+
+        borough, zone = TlcZoneIndex(self.zones).lookup(self.lng, self.lat)
+        self.assertEqual(list(joined.zone.fillna("")), [z or "" for z in zone])
+        self.assertEqual(list(joined.borough.fillna("")), [b or "" for b in borough])
+        self.assertIn(None, zone)
+
+    def test_grid_cache(self) -> None:
+        exact = TlcZoneIndex(self.zones).lookup_indices(self.lng, self.lat)
+        index = TlcZoneIndex(self.zones, cell_size=500)
+        for _ in range(2):
+            self.assertEqual(
+                list(exact), list(index.lookup_indices(self.lng, self.lat))
+            )
+        self.assertGreater(len(index.cells), 100)
+        self.assertIn(NO_ZONE, index.cells.values())
+
+        borough, zone = index.lookup(np.array([np.nan]), np.array([np.nan]))
+        self.assertEqual([None], list(zone))
+
+    def test_lookup_point(self) -> None:
+        index = TlcZoneIndex(self.zones, cell_size=500)
+        borough, zone = index.lookup(self.lng, self.lat)
+        points = list(zip(self.lng, self.lat))
+        self.assertEqual(
+            list(zip(borough, zone)), [index.lookup_point(*p) for p in points]
+        )
+        self.assertEqual((None, None), index.lookup_point(np.nan, np.nan))
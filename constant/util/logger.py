@@ -1,9 +1,155 @@
 # Copyright 2023 O1 Software Network. MIT licensed.
+"""Logging setup, done explicitly by a script's entry point, never at import.
+
+configure_logging() puts a QueueHandler on the root logger, so a hot loop that
+logs merely appends to a queue, and a QueueListener thread does the formatting
+and I/O.  With processes=True the queue is a multiprocessing one, and records
+from pool workers join the parent's records in a single stream, in arrival order.
+Forked workers inherit the handler; spawned ones need init_worker_logging().
+"""
+
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import get_context
 from time import strftime
+from typing import Any, TextIO
+
+TEXT_FORMAT = "%(asctime)s.%(msecs)03d{tz} %(levelname)s %(relativeCreated)5d %(name)s  %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Attributes every LogRecord has.  Any others came from a caller's extra={...}.
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
 
 
-def logging_basic_config(level=logging.INFO):
+def logging_basic_config(level: int = logging.INFO) -> None:
     tz = strftime("%z")
-    fmt = f"%(asctime)s.%(msecs)03d{tz} %(levelname)s %(relativeCreated)5d %(name)s  %(message)s"
-    logging.basicConfig(level=level, datefmt="%Y-%m-%d %H:%M:%S", format=fmt)
+    fmt = TEXT_FORMAT.format(tz=tz)
+    logging.basicConfig(level=level, datefmt=DATE_FORMAT, format=fmt)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as a line of JSON, including fields given as extra=.
+
+    E.g. log.info("loaded", extra=dict(stage="sqlite_load", rows=n)).
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        d: dict[str, Any] = dict(
+            time=datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            level=record.levelname,
+            logger=record.name,
+            process=record.process,
+            message=record.getMessage(),
+        )
+        d |= {k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS}
+        if record.exc_info:
+            d["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            d["exception"] = record.exc_text
+        return json.dumps(d, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """Enqueues a picklable record, keeping any traceback apart from the message.
+
+    The stock prepare() folds the traceback into msg, so JsonFormatter
+    would never see it.  Formatters print exc_text after the message anyway.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+_listener: QueueListener | None = None
+_queue: Any = None  # the multiprocessing queue, in processes=True mode
+
+
+def configure_logging(
+    level: int = logging.INFO,
+    json_lines: bool = False,
+    processes: bool = False,
+    stream: TextIO | None = None,
+) -> QueueListener:
+    """Routes the root logger through a queue, to a listener writing to STREAM.
+
+    Replaces any earlier configuration.  The listener drains the queue at exit.
+    """
+    global _listener, _queue
+    stop_logging()
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if json_lines:
+        handler.setFormatter(JsonFormatter())
+    else:
+        fmt = TEXT_FORMAT.format(tz=strftime("%z"))
+        handler.setFormatter(logging.Formatter(fmt, DATE_FORMAT))
+
+    # A spawn-context queue serves forked workers too, though not vice versa.
+    q: Any = get_context("spawn").Queue() if processes else queue.SimpleQueue()
+    _queue = q if processes else None
+    _listener = QueueListener(q, handler, respect_handler_level=True)
+    _listener.start()
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(_QueueHandler(q))
+    root.setLevel(level)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Flushes queued records and stops the listener, if there is one."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            if isinstance(handler, QueueHandler):
+                root.removeHandler(handler)
+        _listener = None
+
+
+def log_queue() -> Any:
+    """Returns the queue to pass to init_worker_logging(), or None."""
+    return _queue
+
+
+def init_worker_logging(q: Any, level: int = logging.INFO) -> None:
+    """A pool initializer, sending a worker's records to the parent's listener."""
+    if q is None:
+        return
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(_QueueHandler(q))
+    root.setLevel(level)
+
+
+def _after_fork_in_child() -> None:
+    # A forked child has a copy of an in-process queue, which nobody drains.
+    # So it writes directly, to the listener's own handlers.
+    if _listener and _queue is None:
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            if isinstance(handler, QueueHandler):
+                root.removeHandler(handler)
+        for handler in _listener.handlers:
+            root.addHandler(handler)
+
+
+if hasattr(os, "register_at_fork"):  # POSIX only
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+atexit.register(stop_logging)
@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import json
+import logging
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from multiprocessing import get_context
+
+from constant.util.logger import (
+    JsonFormatter,
+    configure_logging,
+    init_worker_logging,
+    log_queue,
+    stop_logging,
+)
+
+log = logging.getLogger(__name__)
+
+
+def _work(i: int) -> int:
+    log.info(f"chunk {i}", extra=dict(stage="transform", rows=10 * i))
+    return i
+
+
+class LoggerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        root = logging.getLogger()
+        self.addCleanup(setattr, root, "handlers", root.handlers[:])
+        self.addCleanup(root.setLevel, root.level)
+        self.addCleanup(stop_logging)
+        self.stream = StringIO()
+
+    def test_json_formatter(self) -> None:
+        record = log.makeRecord(
+            log.name, logging.INFO, __file__, 1, "loaded %d", (7,), None,
+            extra=dict(stage="sqlite_load", rows=7),
+        )  # fmt: skip
+        d = json.loads(JsonFormatter().format(record))
+        self.assertEqual("loaded 7", d["message"])
+        self.assertEqual("INFO", d["level"])
+        self.assertEqual(("sqlite_load", 7), (d["stage"], d["rows"]))
+        self.assertNotIn("args", d)
+
+    def test_configure_logging(self) -> None:
+        configure_logging(stream=self.stream)
+        self.assertIsNone(log_queue())
+        log.debug("not shown")
+        log.info("shown", extra=dict(stage="find_distance"))
+        stop_logging()  # drains the queue
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual(1, len(lines))
+        self.assertTrue(lines[0].endswith("  shown"), lines[0])
+
+    def test_exception(self) -> None:
+        configure_logging(json_lines=True, stream=self.stream)
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            log.exception("boom", extra=dict(stage="transform"))
+        stop_logging()
+        d = json.loads(self.stream.getvalue())
+        self.assertEqual(("boom", "transform"), (d["message"], d["stage"]))
+        self.assertTrue(d["exception"].startswith("Traceback (most recent call"))
+        self.assertTrue(d["exception"].endswith("ZeroDivisionError: division by zero"))
+
+        text = StringIO()
+        configure_logging(stream=text)
+        log.error("boom", exc_info=ValueError("bad"))
+        stop_logging()
+        lines = text.getvalue().splitlines()
+        self.assertTrue(lines[0].endswith("  boom"), lines[0])
+        self.assertEqual("ValueError: bad", lines[-1])
+
+    def test_processes(self) -> None:
+        configure_logging(json_lines=True, processes=True, stream=self.stream)
+        log.info("start", extra=dict(stage="main"))
+        for method in ["fork", "spawn"]:
+            with ProcessPoolExecutor(
+                2,
+                mp_context=get_context(method),
+                initializer=init_worker_logging,
+                initargs=(log_queue(),),
+            ) as pool:
+                self.assertEqual([1, 2, 3], list(pool.map(_work, [1, 2, 3])))
+        stop_logging()
+
+        records = [json.loads(line) for line in self.stream.getvalue().splitlines()]
+        self.assertEqual("start", records[0]["message"])
+        workers = [r for r in records if r.get("stage") == "transform"]
+        self.assertEqual([10, 10, 20, 20, 30, 30], sorted(r["rows"] for r in workers))
+        self.assertTrue(all(r["process"] != records[0]["process"] for r in workers))
@@ -1,6 +1,10 @@
 # Copyright 2023 O1 Software Network. MIT licensed.
+import os
 import sys
+from contextlib import contextmanager
 from pathlib import Path
+from tempfile import mkstemp
+from typing import Generator
 
 
 def repo_top() -> Path:
@@ -25,3 +29,20 @@ def temp_dir() -> Path:
     folder = Path(temporary[sys.platform])
     assert folder.is_dir()
     return folder
+
+
+@contextmanager
+def atomic_write(out_file: Path) -> Generator[Path, None, None]:
+    """Yields a temp file beside OUT_FILE, which then replaces OUT_FILE.
+
+    Each writer gets a uniquely named temp file, so several processes may race
+    to write the same OUT_FILE, and readers never see a partial file.
+    """
+    fd, name = mkstemp(prefix=f".{out_file.name}-", suffix=".tmp", dir=out_file.parent)
+    os.close(fd)
+    temp_file = Path(name)
+    try:
+        yield temp_file
+        os.replace(temp_file, out_file)
+    finally:
+        temp_file.unlink(missing_ok=True)
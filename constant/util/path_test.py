@@ -0,0 +1,28 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from constant.util.path import atomic_write
+
+
+class PathTest(unittest.TestCase):
+    def test_atomic_write(self) -> None:
+        with TemporaryDirectory() as temp:
+            out_file = Path(temp) / "zones.parquet"
+            with atomic_write(out_file) as a, atomic_write(out_file) as b:
+                self.assertNotEqual(a, b)  # racing writers don't collide
+                self.assertEqual(out_file.parent, a.parent)
+                a.write_text("a")
+                b.write_text("b")
+                self.assertFalse(out_file.exists())
+            self.assertEqual("a", out_file.read_text())  # the last to finish
+
+            with self.assertRaises(ValueError):
+                with atomic_write(out_file) as temp_file:
+                    temp_file.write_text("partial")
+                    raise ValueError
+            self.assertEqual("a", out_file.read_text())
+            self.assertEqual(["zones.parquet"], [p.name for p in Path(temp).iterdir()])
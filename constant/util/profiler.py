@@ -0,0 +1,208 @@
+# Copyright 2023 O1 Software Network. MIT licensed.
+"""Aggregated per-stage metrics for functions wrapped by @timed.
+
+Set CONSTANT_PROFILE=1 (or =path/to/profile.json) in the environment, and every
+@timed call is recorded: wall and CPU time, growth of peak RSS, and rows in and
+out for DataFrames.  With CONSTANT_PROFILE_MEMORY=1, tracemalloc peaks are
+recorded as well, at a cost of slowing allocation-heavy code severalfold.
+At exit, a summary table is logged, and a JSON file is written that
+chrome://tracing and https://ui.perfetto.dev can display.  It holds the
+summary too, under "stages".  Only the main process reports.
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import tracemalloc
+from collections import defaultdict
+from logging import getLogger
+from pathlib import Path
+from time import perf_counter, process_time
+from typing import Any, Callable, TypeVar
+
+import numpy as np
+import pandas as pd
+
+from constant.util.path import temp_dir
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore [assignment]
+
+PROFILE_ENV = "CONSTANT_PROFILE"
+MEMORY_ENV = "CONSTANT_PROFILE_MEMORY"
+PROFILE_JSON = temp_dir() / "constant/profile.json"
+
+MAX_TRACE_EVENTS = 100_000
+
+R = TypeVar("R")
+
+log = getLogger(__name__)
+
+
+class StageStats:
+    """Everything recorded about the calls of one function."""
+
+    def __init__(self) -> None:
+        self.wall: list[float] = []  # seconds, one per call
+        self.cpu: list[float] = []
+        self.rss_growth = 0  # bytes, the most that one call raised peak RSS
+        self.traced_peak = 0  # bytes, the highest tracemalloc peak above baseline
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def summary(self) -> dict[str, Any]:
+        wall_p50, wall_p99 = np.percentile(self.wall, [50, 99])
+        cpu_p50, cpu_p99 = np.percentile(self.cpu, [50, 99])
+        total = sum(self.wall)
+        rows = self.rows_in or self.rows_out  # loaders take no DataFrame in
+        return dict(
+            calls=len(self.wall),
+            wall_total=total,
+            wall_p50=wall_p50,
+            wall_p99=wall_p99,
+            cpu_total=sum(self.cpu),
+            cpu_p50=cpu_p50,
+            cpu_p99=cpu_p99,
+            rss_growth_mb=self.rss_growth / 2**20,
+            traced_peak_mb=self.traced_peak / 2**20,
+            rows_in=self.rows_in,
+            rows_out=self.rows_out,
+            rows_per_sec=rows / total if total else 0.0,
+        )
+
+
+class _Frame:
+    """An in-progress call, with its tracemalloc peak from before nested calls."""
+
+    def __init__(self) -> None:
+        self.peak = 0
+
+
+class Profiler:
+    """Records each call() into per-stage stats, and a Chrome trace of events."""
+
+    def __init__(self, out_file: Path = PROFILE_JSON, trace_memory: bool = False):
+        self.out_file = out_file
+        self.trace_memory = trace_memory
+        self.stages: defaultdict[str, StageStats] = defaultdict(StageStats)
+        self.events: list[dict[str, Any]] = []
+        self.dropped_events = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()  # holds each thread's stack of frames
+        self.t0 = perf_counter()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def call(self, name: str, func: Callable[..., R], *args: Any, **kwargs: Any) -> R:
+        stack: list[_Frame] = self.local.__dict__.setdefault("stack", [])
+        if self.trace_memory:
+            # We reset the peak, so save the caller's, and pass ours up later.
+            baseline, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+        frame = _Frame()
+        stack.append(frame)
+        rss_before = _peak_rss()
+        start, cpu_start = perf_counter(), process_time()
+        try:
+            ret = func(*args, **kwargs)
+        finally:
+            wall, cpu = perf_counter() - start, process_time() - cpu_start
+            rss_growth = _peak_rss() - rss_before
+            stack.pop()
+            traced_peak = 0
+            if self.trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], frame.peak)
+                traced_peak = peak - baseline
+                if stack:
+                    stack[-1].peak = max(stack[-1].peak, peak)
+
+        rows_in = next((len(a) for a in args if isinstance(a, pd.DataFrame)), 0)
+        rows_out = len(ret) if isinstance(ret, pd.DataFrame) else 0
+        with self.lock:
+            stats = self.stages[name]
+            stats.wall.append(wall)
+            stats.cpu.append(cpu)
+            stats.rss_growth = max(stats.rss_growth, rss_growth)
+            stats.traced_peak = max(stats.traced_peak, traced_peak)
+            stats.rows_in += rows_in
+            stats.rows_out += rows_out
+            if len(self.events) < MAX_TRACE_EVENTS:
+                self.events.append(
+                    dict(
+                        name=name,
+                        ph="X",  # a "complete" event, with a duration
+                        ts=(start - self.t0) * 1e6,  # microseconds
+                        dur=wall * 1e6,
+                        pid=os.getpid(),
+                        tid=threading.get_ident(),
+                        args=dict(cpu_ms=cpu * 1e3, rows_in=rows_in, rows_out=rows_out),
+                    )
+                )
+            else:
+                self.dropped_events += 1
+        return ret
+
+    def summary(self) -> pd.DataFrame:
+        """Returns a row of stats per stage, with the most total wall time first."""
+        with self.lock:
+            rows = {name: stats.summary() for name, stats in self.stages.items()}
+        df = pd.DataFrame.from_dict(rows, orient="index")
+        df.index.name = "stage"
+        return df.sort_values("wall_total", ascending=False) if len(df) else df
+
+    def report(self) -> None:
+        """Logs the summary table, and writes the trace file."""
+        summary = self.summary()
+        if summary.empty:
+            return
+        log.info(f"  profile of {len(summary)} stages:\n{summary.round(4).to_string()}")
+        self.out_file.parent.mkdir(parents=True, exist_ok=True)
+        trace = dict(
+            traceEvents=self.events,
+            displayTimeUnit="ms",
+            stages=json.loads(summary.to_json(orient="index")),
+            dropped_events=self.dropped_events,
+        )
+        self.out_file.write_text(json.dumps(trace))
+        log.info(f"  wrote {len(self.events):_} trace events to {self.out_file}")
+
+
+def _peak_rss() -> int:
+    """Returns the process's peak resident set size so far, in bytes, or 0."""
+    if resource is None:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024  # else KiB
+
+
+_profiler: Profiler | None = None
+
+
+def enable(out_file: Path = PROFILE_JSON, trace_memory: bool = False) -> Profiler:
+    """Starts recording @timed calls, to be reported at exit."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(out_file, trace_memory)
+        atexit.register(_profiler.report)
+    return _profiler
+
+
+def profiler() -> Profiler | None:
+    """Returns the active profiler, or None when profiling is off."""
+    return _profiler
+
+
+def _enable_from_env() -> None:
+    setting = os.environ.get(PROFILE_ENV, "")
+    if setting and setting != "0":
+        out_file = PROFILE_JSON if setting == "1" else Path(setting)
+        enable(out_file, trace_memory=os.environ.get(MEMORY_ENV, "") == "1")
+
+
+_enable_from_env()
@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# Copyright 2023 O1 Software Network. MIT licensed.
+
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+
+from constant.util.profiler import MEMORY_ENV, PROFILE_ENV, Profiler
+
+
+def _head(df: pd.DataFrame, n: int) -> pd.DataFrame:
+    return df.head(n)
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_call(self) -> None:
+        df = pd.DataFrame({"a": range(100)})
+        with TemporaryDirectory() as temp:
+            out_file = Path(temp) / "profile.json"
+            profiler = Profiler(out_file, trace_memory=True)
+            self.addCleanup(tracemalloc.stop)
+            for n in [10, 20, 30]:
+                self.assertEqual(n, len(profiler.call("head", _head, df, n)))
+
+            def allocate(n: int) -> int:
+                outer = len(bytearray(n))  # freed before the inner call
+                return outer + len(profiler.call("inner", bytearray, n // 2))
+
+            profiler.call("allocate", allocate, 8_000_000)
+            profiler.report()
+            trace = json.loads(out_file.read_text())
+
+        summary = profiler.summary()
+        self.assertEqual(3, summary.calls["head"])
+        self.assertEqual(300, summary.rows_in["head"])
+        self.assertEqual(60, summary.rows_out["head"])
+        self.assertGreaterEqual(summary.wall_p99["head"], summary.wall_p50["head"])
+        # The inner call resets the tracemalloc peak, yet the outer one sees 8 MB.
+        self.assertGreater(summary.traced_peak_mb["allocate"], 7.5)
+        self.assertLess(summary.traced_peak_mb["inner"], 4.5)
+
+        events = trace["traceEvents"]
+        self.assertEqual(["head"] * 3, [e["name"] for e in events[:3]])
+        self.assertEqual({"X"}, {e["ph"] for e in events})
+        self.assertEqual(3, trace["stages"]["head"]["calls"])
+
+    def test_env(self) -> None:
+        script = """
+import pandas as pd
+from constant.util.timing import timed
+
+@timed
+def double(df: pd.DataFrame) -> pd.DataFrame:
+    return pd.concat([df, df])
+
+double(double(pd.DataFrame({"a": [1, 2]})))
+"""
+        with TemporaryDirectory() as temp:
+            out_file = Path(temp) / "profile.json"
+            env = os.environ | {PROFILE_ENV: str(out_file), MEMORY_ENV: "0"}
+            subprocess.run([sys.executable, "-c", script], env=env, check=True)
+            stages = json.loads(out_file.read_text())["stages"]
+        self.assertEqual(["double"], list(stages))
+        self.assertEqual(2, stages["double"]["calls"])
+        self.assertEqual(2 + 4, stages["double"]["rows_in"])
+        self.assertEqual(4 + 8, stages["double"]["rows_out"])
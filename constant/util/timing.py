@@ -1,24 +1,37 @@
 # Copyright 2023 O1 Software Network. MIT licensed.
-from logging import INFO, getLogger
+from logging import getLogger
 from time import time
-from typing import Any, Callable
+from typing import Callable, ParamSpec, TypeVar
 
-from constant.util.logger import logging_basic_config
-
-logging_basic_config(level=INFO)
+from constant.util.profiler import profiler
 
 log = getLogger(__name__)
 
+P = ParamSpec("P")
+R = TypeVar("R")
+
 
 def timed(
-    func: Callable[[Any], Any], reporting_threshold_sec: float = 0.25
-) -> Callable[[Any], Any]:
-    def wrapped(*args: Any, **kwargs: Any) -> Any:
+    func: Callable[P, R], reporting_threshold_sec: float = 0.25
+) -> Callable[P, R]:
+    """Logs slow calls.  When profiling is on, every call is recorded as well."""
+    name = getattr(func, "__qualname__", repr(func))
+    nested = func.__name__ == "wrapped"  # already timed, e.g. by the Etl class
+
+    def wrapped(*args: P.args, **kwargs: P.kwargs) -> R:
         t0 = time()
-        ret = func(*args, **kwargs)
+        prof = profiler()
+        if prof and not nested:
+            ret = prof.call(name, func, *args, **kwargs)
+        else:
+            ret = func(*args, **kwargs)
         elapsed = time() - t0
-        if elapsed > reporting_threshold_sec and func.__name__ != "wrapped":
-            log.info(f"  Elapsed time of {elapsed:.3f} seconds for {func.__name__}")
+        if elapsed > reporting_threshold_sec and not nested:
+            log.info(
+                f"  Elapsed time of {elapsed:.3f} seconds for {func.__name__}",
+                extra=dict(stage=func.__name__, seconds=round(elapsed, 3)),
+            )
         return ret
 
+    wrapped.__wrapped__ = func  # type: ignore [attr-defined]  # for inspect.unwrap()
     return wrapped